@@ -0,0 +1,160 @@
+"""
+Benchmarks for the binder hot paths run against the in-process fake
+Elasticsearch cluster, no network access or live node required.
+
+Measures save latency, reindex_into_es and rebuild_es_index throughput,
+peak memory of a rebuild along with DB query and ES request counts for the
+test app Author and User models.
+
+    python benchmarks/bench_es_binder.py --rows 10000 100000 --latency 0.001
+"""
+import argparse
+import os
+import statistics
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.test_app.settings')
+os.environ['DJANGO_ES_MODEL_FAKE_BACKEND'] = '1'
+
+
+@contextmanager
+def measure(results, name, documents=0, trace_memory=False):
+    """
+    Record duration, DB queries and ES requests made within the block.
+    """
+    from django.db import connection
+    from django_elasticsearch_model_binder.testing import fake_cluster
+
+    queries = [0]
+
+    def count_query(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    if trace_memory:
+        tracemalloc.start()
+
+    es_requests = fake_cluster.request_count
+    start = perf_counter()
+    with connection.execute_wrapper(count_query):
+        yield
+    duration = perf_counter() - start
+
+    result = {
+        'seconds': duration,
+        'db_queries': queries[0],
+        'es_requests': fake_cluster.request_count - es_requests,
+    }
+    if documents:
+        result['docs_per_second'] = documents / duration
+    if trace_memory:
+        result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    results[name] = result
+
+
+def populate(rows):
+    from tests.test_app.models import Author, User
+
+    # Bulk creation bypasses save so nothing is sent to Elasticsearch.
+    User.objects.bulk_create(
+        User(email='user{}@example.com'.format(i))
+        for i in range(max(rows // 10, 1))
+    )
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    Author.objects.bulk_create(
+        (
+            Author(
+                publishing_name='Author {}'.format(i), age=i % 90,
+                user_id=user_ids[i % len(user_ids)],
+            )
+            for i in range(rows)
+        ),
+        batch_size=5000,
+    )
+
+
+def run(rows, saves):
+    from django_elasticsearch_model_binder.testing import fake_cluster
+    from django_elasticsearch_model_binder.utils import (
+        initialize_es_model_index, queryset_iterator,
+    )
+    from tests.test_app.models import Author, User
+
+    Author.objects.all().delete()
+    User.objects.all().delete()
+    fake_cluster.reset()
+    initialize_es_model_index(Author)
+    initialize_es_model_index(User)
+    populate(rows)
+
+    results = {}
+
+    with measure(results, 'reindex_into_es', documents=rows):
+        for qs_chunk in queryset_iterator(Author.objects.all()):
+            qs_chunk.reindex_into_es()
+
+    with measure(results, 'rebuild_es_index', documents=rows):
+        Author.rebuild_es_index()
+
+    with measure(results, 'rebuild_es_index (traced)', trace_memory=True):
+        Author.rebuild_es_index()
+
+    latencies = []
+    with measure(results, 'save', documents=saves):
+        for author in Author.objects.all()[:saves]:
+            start = perf_counter()
+            author.save()
+            latencies.append((perf_counter() - start) * 1000)
+
+    latencies.sort()
+    results['save'].update(
+        mean_ms=statistics.mean(latencies),
+        p95_ms=latencies[int(len(latencies) * 0.95) - 1],
+        db_queries_per_save=results['save']['db_queries'] / len(latencies),
+        es_requests_per_save=results['save']['es_requests'] / len(latencies),
+    )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '--rows', type=int, nargs='+', default=[10000],
+        help='Author table sizes to benchmark, e.g. 10000 100000 1000000.',
+    )
+    parser.add_argument(
+        '--saves', type=int, default=1000,
+        help='Number of individual saves timed per table size.',
+    )
+    parser.add_argument(
+        '--latency', type=float, default=0.0,
+        help='Simulated transport latency per ES request in seconds.',
+    )
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = ':memory:'
+    settings.DJANGO_ES_MODEL_CONFIG['latency'] = args.latency
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+    for rows in args.rows:
+        print('\n{} rows, {}s simulated latency'.format(rows, args.latency))
+        for name, result in run(rows, min(args.saves, rows)).items():
+            print('  {:<28} {}'.format(name, ', '.join(
+                '{}={:.4g}'.format(k, v) for k, v in result.items()
+            )))
+
+
+if __name__ == '__main__':
+    main()
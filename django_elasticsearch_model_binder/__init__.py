@@ -1,5 +1,21 @@
-from django_elasticsearch_model_binder.mixins import ESQuerySetMixin
-from django_elasticsearch_model_binder.models import ESBoundModel
-from django_elasticsearch_model_binder.utils import ExtraModelFieldBase
+from importlib import import_module
 
 __all__ = ['ESBoundModel', 'ESQuerySetMixin', 'ExtraModelFieldBase']
+
+_exports = {
+    'ESBoundModel': 'django_elasticsearch_model_binder.models',
+    'ESQuerySetMixin': 'django_elasticsearch_model_binder.mixins',
+    'ExtraModelFieldBase': 'django_elasticsearch_model_binder.utils',
+}
+
+
+def __getattr__(name):
+    # Exports are resolved lazily so the package can be listed within
+    # INSTALLED_APPS, making its management commands available, without
+    # defining models before the app registry is ready.
+    if name in _exports:
+        return getattr(import_module(_exports[name]), name)
+
+    raise AttributeError(
+        'module {} has no attribute {}'.format(__name__, name)
+    )
@@ -0,0 +1,190 @@
+import atexit
+import logging
+from threading import Lock, Timer
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+from django_elasticsearch_model_binder.circuit import get_es_degraded_spool
+from django_elasticsearch_model_binder.exceptions import (
+    ElasticSearchCircuitOpen,
+)
+from django_elasticsearch_model_binder.utils import send_bulk_writes
+
+logger = logging.getLogger(__name__)
+
+# Write buffer shared by the process, created on first use when configured.
+es_write_buffer_registry = {}
+
+
+class ESWriteBuffer:
+    """
+    In-process buffer coalescing document writes by index and pk so only
+    the last write of each document is sent. Buffered writes are sent in
+    bulk once max_documents are pending, flush_interval_ms after the first
+    pending write, on an explicit flush and at process exit. Writes that
+    can't be sent while the circuit is open are moved to its spool.
+    """
+
+    def __init__(self, max_documents=500, flush_interval_ms=1000):
+        self.max_documents = max_documents
+        self.flush_interval_ms = flush_interval_ms
+        self.operations = {}
+        self._lock = Lock()
+        self._timer = None
+
+    def index(self, index: str, pk, document: dict, routing=None):
+        self._add(index, pk, document, routing)
+
+    def delete(self, index: str, pk, routing=None):
+        self._add(index, pk, None, routing)
+
+    def discard(self, index: str, pk):
+        """
+        Drop any pending write of a document, so a write sent directly
+        isn't overwritten by an older buffered one.
+        """
+        with self._lock:
+            self.operations.pop((index, pk), None)
+
+    def _add(self, index, pk, document, routing):
+        with self._lock:
+            # Re-insert so the document is sent in the order last written.
+            self.operations.pop((index, pk), None)
+            self.operations[index, pk] = (document, routing)
+            pending = len(self.operations)
+
+            if pending < self.max_documents:
+                self._start_timer()
+
+        if pending >= self.max_documents:
+            self.flush()
+
+    def _start_timer(self):
+        if self._timer is None:
+            self._timer = Timer(
+                self.flush_interval_ms / 1000, self._flush_on_timer,
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed flushing buffered Elasticsearch writes')
+
+    def flush(self, refresh=None) -> int:
+        """
+        Send all pending writes in bulk, returning the number sent. Set
+        refresh='wait_for' to return once the writes are visible to search.
+        Raises ElasticSearchFailure with the failing items of any rejected
+        writes, writes that weren't sent and weren't rejected outright are
+        kept pending to be retried by the next flush.
+        """
+        with self._lock:
+            operations, self.operations = self.operations, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not operations:
+            return 0
+
+        # Writes are queued behind any spooled writes so they aren't
+        # overwritten by them once the spool drains.
+        spool = get_es_degraded_spool()
+        if spool is None:
+            try:
+                return send_bulk_writes(
+                    operations, chunk_size=self.max_documents,
+                    refresh=refresh,
+                )
+            except ElasticSearchCircuitOpen:
+                # Hold the writes until the cluster is back if spooling.
+                spool = get_es_degraded_spool()
+                if spool is None:
+                    self._restore(operations)
+                    raise
+            except Exception:
+                self._restore(operations)
+                raise
+
+        try:
+            spool.extend(operations)
+        except ElasticSearchCircuitOpen:
+            self._restore(operations)
+            raise
+        return 0
+
+    def _restore(self, operations):
+        """
+        Return unsent operations to the buffer, without replacing any
+        written since they were taken, and schedule them to be retried.
+        """
+        with self._lock:
+            self.operations = {**operations, **self.operations}
+            if self.operations:
+                self._start_timer()
+
+
+def get_es_write_buffer(instance=None):
+    """
+    Return the shared write buffer configured by DJANGO_ES_MODEL_WRITE_BUFFER,
+    a dict of ESWriteBuffer arguments, or None when it isn't set. Given a
+    model instance None is also returned unless its model sets
+    es_buffer_writes and its database connection isn't in an atomic block,
+    leaving writes made within transactions unbuffered.
+    """
+    if instance is not None and (
+        not instance.es_buffer_writes
+        or connections[instance._state.db or 'default'].in_atomic_block
+    ):
+        return None
+
+    if 'default' in es_write_buffer_registry:
+        return es_write_buffer_registry['default']
+
+    config = getattr(settings, 'DJANGO_ES_MODEL_WRITE_BUFFER', None)
+    if not config:
+        return None
+
+    write_buffer = es_write_buffer_registry.setdefault(
+        'default', ESWriteBuffer(**config),
+    )
+    atexit.register(write_buffer.flush)
+    return write_buffer
+
+
+def flush_es_write_buffer(refresh=None) -> int:
+    """
+    Flush the shared write buffer if one is in use, returning the number of
+    writes sent.
+    """
+    if 'default' not in es_write_buffer_registry:
+        return 0
+
+    return es_write_buffer_registry['default'].flush(refresh=refresh)
+
+
+def discard_es_buffered_write(index: str, pk):
+    """
+    Drop any write of a document pending in the shared write buffer, call
+    before writing the document directly.
+    """
+    if 'default' in es_write_buffer_registry:
+        es_write_buffer_registry['default'].discard(index, pk)
+
+
+@receiver(setting_changed)
+def reset_es_write_buffer(setting, **kwargs):
+    """
+    Flush and drop the shared write buffer when its configuration changes.
+    """
+    if setting == 'DJANGO_ES_MODEL_WRITE_BUFFER':
+        write_buffer = es_write_buffer_registry.pop('default', None)
+        if write_buffer is not None:
+            atexit.unregister(write_buffer.flush)
+            write_buffer.flush()
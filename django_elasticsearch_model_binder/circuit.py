@@ -0,0 +1,296 @@
+import atexit
+import logging
+from itertools import islice
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import Signal, receiver
+from elasticsearch.exceptions import ConnectionError, TransportError
+
+from django_elasticsearch_model_binder.exceptions import (
+    ElasticSearchCircuitOpen,
+)
+from django_elasticsearch_model_binder.instrumentation import (
+    InstrumentedTransport,
+)
+
+logger = logging.getLogger(__name__)
+
+# Sent with the ESCircuitBreaker when a request succeeds while writes are
+# spooled and no drain of the spool is running, or with wait set as the
+# process exits so they're sent before it does.
+es_write_spool_pending = Signal()
+
+# Circuit breaker shared by the process, created on first use when
+# configured.
+es_circuit_breaker_registry = {}
+
+# Response statuses taken to mean the cluster is unhealthy.
+ES_OUTAGE_STATUSES = (429, 502, 503, 504)
+
+
+class ESWriteSpool:
+    """
+    Writes held while the circuit is open, documents and their routing
+    keyed by index and pk so only the last write of each document is
+    kept. A document of None is a delete.
+    """
+
+    def __init__(self, max_documents):
+        self.max_documents = max_documents
+        self.operations = {}
+        self._lock = Lock()
+
+    def index(self, index: str, pk, document: dict, routing=None):
+        self.extend({(index, pk): (document, routing)})
+
+    def delete(self, index: str, pk, routing=None):
+        self.extend({(index, pk): (None, routing)})
+
+    def extend(self, operations: dict):
+        """
+        Spool operations, raising ElasticSearchCircuitOpen if doing so
+        would hold more than max_documents.
+        """
+        with self._lock:
+            new = len(operations.keys() - self.operations.keys())
+            if len(self.operations) + new > self.max_documents:
+                raise ElasticSearchCircuitOpen(
+                    'Elasticsearch is unavailable and the write spool is '
+                    'full with {} documents.'.format(len(self.operations))
+                )
+
+            for key, operation in operations.items():
+                self.operations.pop(key, None)
+                self.operations[key] = operation
+
+    def take(self, limit=None) -> dict:
+        """
+        Remove and return the earliest spooled operations, up to limit if
+        set.
+        """
+        with self._lock:
+            if limit is None or limit >= len(self.operations):
+                operations, self.operations = self.operations, {}
+            else:
+                keys = list(islice(self.operations.keys(), limit))
+                operations = {
+                    key: self.operations.pop(key) for key in keys
+                }
+        return operations
+
+    def restore(self, operations: dict):
+        """
+        Return operations that failed to send to the spool, without
+        replacing any written to it since they were taken.
+        """
+        with self._lock:
+            self.operations = {**operations, **self.operations}
+
+
+class ESCircuitBreaker:
+    """
+    Opens once failure_threshold requests in a row fail with a connection
+    error or an unhealthy status, after which requests are rejected with
+    ElasticSearchCircuitOpen instead of waiting on the cluster. Once
+    reset_timeout_ms has passed the next request is let through as a
+    probe, closing the circuit if it succeeds or reopening it if not.
+    While rejecting requests writes from saves and deletes are spooled,
+    up to spool_max_documents. Once a request succeeds the spool is drained
+    in the background, spool_drain_batch_size writes per bulk request, with
+    writes made meanwhile spooled behind them so they aren't overwritten.
+    The spool is held in memory, a last drain is attempted as the process
+    exits but writes still spooled when it does are lost, and logged.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout_ms=30000,
+                 spool_max_documents=10000, spool_drain_batch_size=500):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_ms = reset_timeout_ms
+        self.spool = ESWriteSpool(spool_max_documents)
+        self.spool_drain_batch_size = spool_drain_batch_size
+        # Held while the spool is being drained, along with the thread
+        # draining it.
+        self.drain_lock = Lock()
+        self.drain_thread = None
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = Lock()
+
+    def _retry_due(self) -> bool:
+        return monotonic() - self.opened_at >= self.reset_timeout_ms / 1000
+
+    def is_rejecting(self) -> bool:
+        """
+        Whether a request made now would be rejected.
+        """
+        with self._lock:
+            return self.state == self.HALF_OPEN or (
+                self.state == self.OPEN and not self._retry_due()
+            )
+
+    def before_request(self):
+        """
+        Raise ElasticSearchCircuitOpen unless the circuit is closed or the
+        request is to be the probe.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            if self.state == self.OPEN and self._retry_due():
+                self.state = self.HALF_OPEN
+                return
+
+        raise ElasticSearchCircuitOpen(
+            'Elasticsearch requests are failing fast after {} failures, '
+            'retrying after {}ms.'.format(
+                self.failures, self.reset_timeout_ms,
+            )
+        )
+
+    def is_draining(self) -> bool:
+        """
+        Whether spooled writes are being sent.
+        """
+        return self.drain_lock.locked()
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+        if self.spool.operations and not self.is_draining():
+            es_write_spool_pending.send(
+                sender=type(self), circuit_breaker=self,
+            )
+
+    def drain_at_exit(self):
+        """
+        Send spooled writes from the calling thread, once any drain running
+        has finished, logging those which couldn't be sent. Registered to
+        run as the process exits.
+        """
+        if not self.spool.operations:
+            return
+
+        logger.warning(
+            'Draining {} spooled Elasticsearch writes before '
+            'exiting'.format(len(self.spool.operations))
+        )
+        es_write_spool_pending.send(
+            sender=type(self), circuit_breaker=self, wait=True,
+        )
+        if self.spool.operations:
+            logger.error(
+                'Lost {} spooled Elasticsearch writes which could not be '
+                'sent before exiting'.format(len(self.spool.operations))
+            )
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if (
+                self.state == self.HALF_OPEN
+                or self.failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self.opened_at = monotonic()
+
+
+def is_es_outage_error(error) -> bool:
+    """
+    Whether error suggests the cluster is unavailable rather than the
+    request being at fault.
+    """
+    return isinstance(error, ConnectionError) or (
+        isinstance(error, TransportError)
+        and error.status_code in ES_OUTAGE_STATUSES
+    )
+
+
+def get_es_circuit_breaker():
+    """
+    Return the shared circuit breaker configured by
+    DJANGO_ES_MODEL_CIRCUIT_BREAKER, a dict of ESCircuitBreaker arguments,
+    or None when it isn't set.
+    """
+    if 'default' in es_circuit_breaker_registry:
+        return es_circuit_breaker_registry['default']
+
+    config = getattr(settings, 'DJANGO_ES_MODEL_CIRCUIT_BREAKER', None)
+    if not config:
+        return None
+
+    circuit_breaker = es_circuit_breaker_registry.setdefault(
+        'default', ESCircuitBreaker(**config),
+    )
+    atexit.register(circuit_breaker.drain_at_exit)
+    return circuit_breaker
+
+
+def get_es_degraded_spool():
+    """
+    Return the spool writes should be sent to while the circuit is
+    rejecting requests or the spool is being drained, otherwise None.
+    """
+    circuit_breaker = get_es_circuit_breaker()
+    if (
+        circuit_breaker is None
+        or not circuit_breaker.spool.max_documents
+        or not (
+            circuit_breaker.is_rejecting() or circuit_breaker.is_draining()
+        )
+    ):
+        return None
+
+    return circuit_breaker.spool
+
+
+class CircuitBreakerTransport(InstrumentedTransport):
+    """
+    Transport guarding requests with the shared circuit breaker, used by
+    the client from get_es_client when DJANGO_ES_MODEL_CIRCUIT_BREAKER is
+    set unless a transport_class is.
+    """
+
+    def perform_request(self, method, url, headers=None, params=None,
+                        body=None):
+        circuit_breaker = get_es_circuit_breaker()
+        if circuit_breaker is None:
+            return super().perform_request(
+                method, url, headers=headers, params=params, body=body,
+            )
+
+        circuit_breaker.before_request()
+        try:
+            response = super().perform_request(
+                method, url, headers=headers, params=params, body=body,
+            )
+        except Exception as e:
+            if is_es_outage_error(e):
+                circuit_breaker.record_failure()
+            else:
+                circuit_breaker.record_success()
+            raise
+
+        circuit_breaker.record_success()
+        return response
+
+
+@receiver(setting_changed)
+def reset_es_circuit_breaker(setting, **kwargs):
+    """
+    Drop the shared circuit breaker when its configuration changes.
+    """
+    if setting == 'DJANGO_ES_MODEL_CIRCUIT_BREAKER':
+        circuit_breaker = es_circuit_breaker_registry.pop('default', None)
+        if circuit_breaker is not None:
+            atexit.unregister(circuit_breaker.drain_at_exit)
@@ -20,3 +20,7 @@ class UnableToCastESNominatedFieldException(ElasticSearchFailure):
 
 class UnableToBulkIndexModelsToElasticSearch(Exception):
     pass
+
+
+class ElasticSearchCircuitOpen(ElasticSearchFailure):
+    pass
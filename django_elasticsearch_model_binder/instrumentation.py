@@ -0,0 +1,203 @@
+import logging
+from contextlib import contextmanager
+from threading import Lock, local
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection
+from django.dispatch import Signal
+from elasticsearch import Transport
+
+logger = logging.getLogger(__name__)
+
+# Sent with the ESOperationSpan of each completed binder operation, sender
+# is the model class operated on.
+es_operation_completed = Signal()
+
+# Spans of the operations in progress on the current thread, outermost
+# first. Requests made while an operation is active count towards each.
+_active_spans = local()
+
+
+class ESOperationSpan:
+    """
+    Measurements taken over a single binder operation.
+    """
+
+    def __init__(self, model, operation):
+        self.model = model
+        self.operation = operation
+        self.documents = 0
+        self.es_requests = 0
+        self.bytes_sent = 0
+        self.es_took_ms = 0
+        self.db_queries = 0
+        self.duration_ms = 0.0
+        self.error = None
+
+    def __repr__(self):
+        return '<ESOperationSpan {}.{} {:.2f}ms>'.format(
+            getattr(self.model, '__name__', None), self.operation,
+            self.duration_ms,
+        )
+
+
+def get_active_es_spans() -> list:
+    """
+    Return spans for the operations in progress on the current thread.
+    """
+    return getattr(_active_spans, 'spans', [])
+
+
+@contextmanager
+def measure_es_span(span):
+    """
+    Attribute the DB queries made and ES requests sent within the block to
+    span, along with the time taken.
+    """
+    def count_query(execute, sql, params, many, context):
+        span.db_queries += 1
+        return execute(sql, params, many, context)
+
+    if not hasattr(_active_spans, 'spans'):
+        _active_spans.spans = []
+    _active_spans.spans.append(span)
+
+    start = perf_counter()
+    try:
+        with connection.execute_wrapper(count_query):
+            yield span
+    finally:
+        span.duration_ms = (perf_counter() - start) * 1000
+        _active_spans.spans.remove(span)
+
+
+@contextmanager
+def instrument_es_operation(model, operation, documents=0):
+    """
+    Measure the enclosed operation, sending es_operation_completed with the
+    resulting span and logging rather than raising errors of its receivers.
+    Yields None and measures nothing when no receivers are connected, so
+    callers should check the span before updating it.
+    """
+    if not es_operation_completed.has_listeners():
+        yield None
+        return
+
+    span = ESOperationSpan(model, operation)
+    span.documents = documents
+
+    try:
+        with measure_es_span(span):
+            yield span
+    except Exception as e:
+        span.error = e
+        raise
+    finally:
+        # Receivers failing mustn't fail or mask the outcome of the operation.
+        for receiver, response in es_operation_completed.send_robust(
+            sender=model, span=span,
+        ):
+            if isinstance(response, Exception):
+                logger.error(
+                    'Receiver %r of es_operation_completed failed', receiver,
+                    exc_info=response,
+                )
+
+
+class InstrumentedTransport(Transport):
+    """
+    Transport attributing the requests it sends to the active spans, used
+    by the client from get_es_client unless a transport_class is set.
+    """
+
+    def perform_request(self, method, url, headers=None, params=None,
+                        body=None):
+        spans = get_active_es_spans()
+        if not spans:
+            return super().perform_request(
+                method, url, headers=headers, params=params, body=body,
+            )
+
+        # Serialize up front to measure the payload, the serializer passes
+        # strings through so this doesn't encode the body twice.
+        if body is not None and not isinstance(body, (str, bytes)):
+            body = self.serializer.dumps(body)
+
+        response = super().perform_request(
+            method, url, headers=headers, params=params, body=body,
+        )
+
+        took = response.get('took', 0) if isinstance(response, dict) else 0
+        if isinstance(body, str):
+            body_size = len(body.encode('utf-8'))
+        else:
+            body_size = len(body or b'')
+
+        for span in spans:
+            span.es_requests += 1
+            span.es_took_ms += took
+            span.bytes_sent += body_size
+
+        return response
+
+
+class ESOperationStats:
+    """
+    In-memory aggregate of completed spans keyed by model and operation,
+    connect to start collecting.
+    """
+
+    fields = (
+        'documents', 'es_requests', 'bytes_sent',
+        'es_took_ms', 'db_queries', 'duration_ms',
+    )
+
+    def __init__(self):
+        self.stats = {}
+        self._lock = Lock()
+
+    def connect(self):
+        es_operation_completed.connect(
+            self.record, weak=False, dispatch_uid=id(self),
+        )
+
+    def disconnect(self):
+        es_operation_completed.disconnect(dispatch_uid=id(self))
+
+    def record(self, sender, span, **kwargs):
+        key = (sender.__name__, span.operation)
+        with self._lock:
+            stats = self.stats.setdefault(key, dict(
+                {field: 0 for field in self.fields},
+                count=0, errors=0, max_duration_ms=0.0,
+            ))
+            stats['count'] += 1
+            stats['errors'] += span.error is not None
+            stats['max_duration_ms'] = max(
+                stats['max_duration_ms'], span.duration_ms,
+            )
+            for field in self.fields:
+                stats[field] += getattr(span, field)
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+
+def log_slow_es_operation(sender, span, **kwargs):
+    """
+    Receiver logging a warning for operations taking longer than
+    DJANGO_ES_MODEL_SLOW_OPERATION_MS, connect to es_operation_completed
+    to enable.
+    """
+    threshold = getattr(settings, 'DJANGO_ES_MODEL_SLOW_OPERATION_MS', 1000)
+    if span.duration_ms < threshold:
+        return
+
+    logger.warning(
+        'Slow Elasticsearch %s on %s took %.2fms, %d documents, '
+        '%d requests, %d bytes, %dms in Elasticsearch, %d DB queries',
+        span.operation, sender.__name__, span.duration_ms, span.documents,
+        span.es_requests, span.bytes_sent, span.es_took_ms, span.db_queries,
+    )
@@ -0,0 +1,36 @@
+import os
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from django_elasticsearch_model_binder.utils import export_es_documents
+
+
+class Command(BaseCommand):
+    help = (
+        'Export the Elasticsearch documents of an ESBoundModel to gzipped '
+        'NDJSON files split by pk range, for loading with import_es_documents.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='Model as app_label.ModelName.')
+        parser.add_argument('directory', help='Directory to write files to.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--documents-per-file', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+
+        os.makedirs(options['directory'], exist_ok=True)
+
+        paths = export_es_documents(
+            model.objects.all(), options['directory'],
+            chunk_size=options['chunk_size'],
+            documents_per_file=options['documents_per_file'],
+        )
+
+        for path in paths:
+            self.stdout.write(path)
@@ -0,0 +1,34 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from django_elasticsearch_model_binder.utils import import_es_documents
+
+
+class Command(BaseCommand):
+    help = (
+        'Load NDJSON files written by export_es_documents into a new index '
+        'for an ESBoundModel, switching the model aliases over to it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='Model as app_label.ModelName.')
+        parser.add_argument('paths', nargs='+', help='Files to load.')
+        parser.add_argument(
+            '--keep-old-index', action='store_true',
+            help='Keep the index previously bound to the model aliases.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+
+        new_indicy = import_es_documents(
+            model, sorted(options['paths']),
+            drop_old_index=not options['keep_old_index'],
+            chunk_size=options['chunk_size'],
+        )
+
+        self.stdout.write('Bound {} to {}'.format(model.__name__, new_indicy))
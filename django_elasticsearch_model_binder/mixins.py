@@ -4,8 +4,12 @@ from elasticsearch.helpers import bulk
 from django_elasticsearch_model_binder.exceptions import (
     UnableToBulkIndexModelsToElasticSearch,
 )
+from django_elasticsearch_model_binder.instrumentation import (
+    instrument_es_operation,
+)
 from django_elasticsearch_model_binder.utils import (
-    build_documents_from_queryset, get_es_client,
+    build_documents_from_queryset, bulk_index_documents, get_es_client,
+    initialize_es_model_index,
 )
 
 
@@ -15,51 +19,103 @@ class ESQuerySetMixin:
     implementation to querysets.
     """
 
-    def reindex_into_es(self):
+    def reindex_into_es(self, partition=None):
         """
-        Generate and bulk re-index all nominated fields into elasticsearch
+        Generate and bulk re-index all nominated fields into elasticsearch,
+        returning the number of documents indexed. Models of partitioned
+        models are indexed a partition at a time unless partition is set,
+        in which case the queryset should only hold models within it.
         """
-        try:
-            bulk(
-                get_es_client(), build_documents_from_queryset(self).values(),
-                index=self.model.get_write_alias_name(),
-                doc_type='_doc',
+        if self.model.es_partition_field and partition is None:
+            return sum(
+                self.model.filter_es_partition(self, partition)
+                .reindex_into_es(partition=partition)
+                for partition in self.model.get_es_partitions(self)
             )
-        except Exception as e:
-            raise UnableToBulkIndexModelsToElasticSearch(e)
 
-    def delete_from_es(self):
+        with instrument_es_operation(self.model, 'reindex_into_es') as span:
+            try:
+                if partition is not None:
+                    initialize_es_model_index(self.model, partition)
+
+                indexed = bulk_index_documents(
+                    build_documents_from_queryset(self).values(),
+                    index=self.model.get_es_alias_names(partition)[1],
+                )
+            except Exception as e:
+                raise UnableToBulkIndexModelsToElasticSearch(e)
+
+            if span:
+                span.documents = indexed
+
+        return indexed
+
+    def delete_from_es(self, partition=None):
         """
-        Bulk remove models in queryset that exist within ES.
+        Bulk remove models in queryset that exist within ES, a partition at
+        a time for partitioned models unless partition is set.
         """
-        model_documents_to_remove = [
-            {'_id': pk, '_op_type': 'delete'}
-            for pk in self.values_list('pk', flat=True)
-        ]
-        bulk(
-            get_es_client(), model_documents_to_remove,
-            index=self.model.get_write_alias_name(),
-            doc_type='_doc'
-        )
-
-    def filter_by_es_search(self, query, sort_query={}):
+        if self.model.es_partition_field and partition is None:
+            for partition in self.model.get_es_partitions(self):
+                (
+                    self.model.filter_es_partition(self, partition)
+                    .delete_from_es(partition=partition)
+                )
+            return
+
+        with instrument_es_operation(self.model, 'delete_from_es') as span:
+            routing_field = self.model.es_routing_field
+            if routing_field:
+                model_documents_to_remove = [
+                    {
+                        '_id': pk, '_op_type': 'delete',
+                        'routing': self.model.get_es_routing_value(value),
+                    }
+                    for pk, value in self.values_list(
+                        'pk',
+                        self.model._meta.get_field(routing_field).attname,
+                    )
+                ]
+            else:
+                model_documents_to_remove = [
+                    {'_id': pk, '_op_type': 'delete'}
+                    for pk in self.values_list('pk', flat=True)
+                ]
+            bulk(
+                get_es_client(), model_documents_to_remove,
+                index=self.model.get_es_alias_names(partition)[1],
+                doc_type='_doc'
+            )
+
+            if span:
+                span.documents = len(model_documents_to_remove)
+
+    def filter_by_es_search(self, query, sort_query={}, routing=None):
         """
         Taking an ES search query return the models that are
         resolved by the search.
 
         Queryset ordering can be denoted by setting sort_query, otherwise
-        sorting will be determined by set model ordering.
+        sorting will be determined by set model ordering. Set routing to
+        only search the shard documents with that routing value are on.
         """
-        results = get_es_client().search(
-            _source=False,
-            index=self.model.get_read_alias_name(),
-            body={
-                'query': query,
-                'sort': sort_query,
-            }
-        )
+        with instrument_es_operation(
+            self.model, 'filter_by_es_search'
+        ) as span:
+            results = get_es_client().search(
+                _source=False,
+                index=self.model.get_read_alias_name(),
+                routing=routing,
+                body={
+                    'query': query,
+                    'sort': sort_query,
+                }
+            )
 
-        model_pks = [d['_id'] for d in results['hits']['hits']]
+            model_pks = [d['_id'] for d in results['hits']['hits']]
+
+            if span:
+                span.documents = len(model_pks)
 
         # Force query to return in the order set by the sort_query
         if sort_query:
@@ -70,20 +126,94 @@ class ESQuerySetMixin:
 
         return self.filter(pk__in=model_pks)
 
+    def search_es_documents(self, query, sort_query=None, offset=0,
+                            limit=10, routing=None) -> list:
+        """
+        Taking an ES search query return the matching documents built from
+        their _source as the model's read-only document class, skipping the
+        database entirely. Paging and sorting are left to ES, filters
+        applied to the queryset are not taken into account.
+        """
+        document_class = self.model.get_es_document_class()
+        body = {'query': query, 'from': offset, 'size': limit}
+        if sort_query:
+            body['sort'] = sort_query
+
+        with instrument_es_operation(
+            self.model, 'search_es_documents'
+        ) as span:
+            results = get_es_client().search(
+                index=self.model.get_read_alias_name(), body=body,
+                routing=routing,
+            )
+
+            # The pk is taken from the document id, the first field of the
+            # document class, the rest from _source.
+            documents = [
+                document_class._make(
+                    [self.model._meta.pk.to_python(hit['_id'])] + [
+                        hit['_source'].get(field)
+                        for field in document_class._fields[1:]
+                    ]
+                )
+                for hit in results['hits']['hits']
+            ]
+
+            if span:
+                span.documents = len(documents)
+
+        return documents
+
+    def count_by_es_search(self, query, routing=None) -> int:
+        """
+        Count the documents matching an ES search query using the count
+        endpoint, without loading any models. Filters applied to the
+        queryset are not taken into account.
+        """
+        with instrument_es_operation(self.model, 'count_by_es_search'):
+            return get_es_client().count(
+                index=self.model.get_read_alias_name(),
+                body={'query': query}, routing=routing,
+            )['count']
+
+    def aggregate_by_es_search(self, aggregations, query=None,
+                               routing=None) -> dict:
+        """
+        Run ES aggregations, for example terms, histogram or stats, over
+        the documents matching query, or every document if unset. Returns
+        the aggregation results keyed by aggregation name, no hits are
+        fetched and no models are loaded.
+        """
+        body = {'size': 0, 'aggs': aggregations}
+        if query is not None:
+            body['query'] = query
+
+        with instrument_es_operation(self.model, 'aggregate_by_es_search'):
+            return get_es_client().search(
+                index=self.model.get_read_alias_name(), body=body,
+                routing=routing,
+            )['aggregations']
+
     def retrieve_es_docs(self, only_include_fields=True):
         """
         Retrieve all ES Cached fields for the queryset. Set
         only_include_source=False to return verbose response
         from ElasticSearch.
         """
-        results = get_es_client().search(
-            index=self.model.get_read_alias_name(),
-            body={
-                'query': {
-                    'ids': {'values': list(self.values_list('pk', flat=True))}
+        with instrument_es_operation(self.model, 'retrieve_es_docs') as span:
+            results = get_es_client().search(
+                index=self.model.get_read_alias_name(),
+                body={
+                    'query': {
+                        'ids': {
+                            'values': list(self.values_list('pk', flat=True))
+                        }
+                    }
                 }
-            }
-        )
+            )
+
+            if span:
+                span.documents = len(results['hits']['hits'])
 
         if only_include_fields:
             return [
@@ -1,21 +1,51 @@
-from datetime import datetime, date
-from uuid import uuid4
-
-from django.db.models import Model
-from elasticsearch.exceptions import NotFoundError
-
+import hashlib
+import re
+from collections import namedtuple
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+from typing import List
+from uuid import UUID, uuid4
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import DateField, DateTimeField, Max, Model
+from django.db.models.signals import class_prepared
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.text import slugify
+from elasticsearch.exceptions import NotFoundError, RequestError
+from elasticsearch.helpers import bulk
+
+from django_elasticsearch_model_binder.buffer import (
+    discard_es_buffered_write, get_es_write_buffer,
+)
+from django_elasticsearch_model_binder.circuit import get_es_degraded_spool
 from django_elasticsearch_model_binder.exceptions import (
     ElasticSearchFailure,
     UnableToCastESNominatedFieldException,
     UnableToDeleteModelFromElasticSearch,
     UnableToSaveModelToElasticSearch,
 )
+from django_elasticsearch_model_binder.instrumentation import (
+    instrument_es_operation,
+)
 from django_elasticsearch_model_binder.utils import (
-    build_document_from_model, get_es_client,
-    get_index_names_from_alias, queryset_iterator,
+    build_document_from_model, build_documents_from_queryset,
+    build_index_mapping, cache_alias_indices, clear_es_alias_cache,
+    convert_datetime_to_es_format, es_document_id_iterator, get_es_client,
+    get_es_field_converter, get_es_sync_watermark, get_index_names_from_alias,
+    initialize_es_model_index, queryset_iterator,
+    record_es_rebuild_change, resolve_alias_indices, set_es_sync_watermark,
+    start_es_rebuild_change_log, stop_es_rebuild_change_log,
 )
 
 
+# Alias names generated for each model, keyed by model and alias kind.
+es_alias_names = {}
+
+# Read-only document classes built for each model's ES documents.
+es_document_classes = {}
+
+
 class ESBoundModel(Model):
     """
     Mixin that binds a models nominated field to an Elasticsearch index.
@@ -36,6 +66,32 @@ class ESBoundModel(Model):
     es_index_alias_read_postfix = 'read'
     es_index_alias_write_postfix = 'write'
 
+    # Nominated fields only stored for retrieval, not searched or sorted on.
+    es_unindexed_fields = []
+
+    # Nominated fields searchable but left out of the stored document.
+    es_source_excludes = []
+
+    # Timestamp or version field bumped on every write, used to catch the
+    # new index up on changes made by other processes during a rebuild.
+    es_updated_at_field = None
+
+    # Coalesce saves and deletes made outside atomic blocks in the write
+    # buffer configured by DJANGO_ES_MODEL_WRITE_BUFFER.
+    es_buffer_writes = False
+
+    # Field splitting documents between per-partition indices, each with its
+    # own aliases while the read alias spans them all. Date values are
+    # bucketed by es_partition_date_format, any other value is a partition
+    # of its own. The format may only use the %Y, %m and %d directives, from
+    # the year down. The field shouldn't change once a model is saved.
+    es_partition_field = None
+    es_partition_date_format = '%Y-%m'
+
+    # Nominated field whose value documents are routed to shards by, pass
+    # the same value as routing when searching to only query its shard.
+    es_routing_field = None
+
     @classmethod
     def get_index_base_name(cls) -> str:
         """
@@ -57,12 +113,18 @@ class ESBoundModel(Model):
         is indexable within ElasticSearch. extend with your own super
         implentation if there are custom types you'd like handled differently.
         """
-        if isinstance(value, Model):
-            return value.pk
-        elif isinstance(value, datetime) or isinstance(value, date):
-            return value.strftime('%d-%M-%Y %H:%M:%S')
-        elif isinstance(value, int) or isinstance(value, float):
+        if value is None or isinstance(value, (bool, int, float, dict, list)):
             return value
+        elif isinstance(value, Model):
+            return value.pk
+        elif isinstance(value, datetime):
+            return convert_datetime_to_es_format(value)
+        elif isinstance(value, date):
+            return value.isoformat()
+        elif isinstance(value, Decimal):
+            return float(value)
+        elif isinstance(value, UUID):
+            return str(value)
         else:
             # Catch all try to cast value to string raising
             # an exception explicitly if that fails.
@@ -71,96 +133,383 @@ class ESBoundModel(Model):
             except Exception as e:
                 raise UnableToCastESNominatedFieldException(e)
 
+    @classmethod
+    def get_es_field_converter(cls, field):
+        """
+        Return the callable used to cast values of a model field into an
+        indexable format, selected once per field and applied to each value
+        in turn. Returns None where values can be indexed as they are, fields
+        of unknown types are cast with convert_model_field_to_es_format.
+        Models overriding convert_model_field_to_es_format have every value
+        cast with it instead.
+        """
+        if (
+            cls.convert_model_field_to_es_format.__func__
+            is not ESBoundModel.convert_model_field_to_es_format.__func__
+        ):
+            return cls.convert_model_field_to_es_format
+
+        return get_es_field_converter(
+            field, cls.convert_model_field_to_es_format,
+        )
+
     def save(self, *args, **kwargs):
         """
         Override model save to index those fields nominated by
         es_cached_model_fields storring them in elasticsearch.
         """
-        super().save(*args, **kwargs)
+        with instrument_es_operation(type(self), 'save', documents=1):
+            super().save(*args, **kwargs)
 
-        try:
-            get_es_client().index(
-                id=self.pk,
-                index=self.get_write_alias_name(),
-                body=build_document_from_model(self),
-            )
-        except Exception:
-            raise UnableToSaveModelToElasticSearch(
-                'Attempted to save/update the {} related es document '
-                'from index {}, please check your '
-                'connection and status of your ES cluster.'.format(
-                    str(self), self.get_index_base_name()
+            try:
+                document = build_document_from_model(self)
+                partition = self.get_es_document_partition()
+                if partition is not None:
+                    # Generate the index for the first model of a partition.
+                    initialize_es_model_index(type(self), partition)
+                read_alias, write_alias = self.get_es_alias_names(partition)
+                routing = self.get_es_routing()
+
+                # Hold writes in the spool rather than failing while the
+                # cluster is unavailable.
+                write_buffer = (
+                    get_es_degraded_spool() or get_es_write_buffer(self)
+                )
+                if write_buffer is not None:
+                    write_buffer.index(write_alias, self.pk, document, routing)
+                else:
+                    discard_es_buffered_write(write_alias, self.pk)
+                    get_es_client().index(
+                        id=self.pk, index=write_alias, body=document,
+                        routing=routing,
+                    )
+
+                if record_es_rebuild_change(type(self), self.pk):
+                    # Keep the index still serving reads current until the
+                    # rebuild switches the read alias over to the new index.
+                    if write_buffer is not None:
+                        write_buffer.index(
+                            read_alias, self.pk, document, routing,
+                        )
+                    else:
+                        discard_es_buffered_write(read_alias, self.pk)
+                        get_es_client().index(
+                            id=self.pk, index=read_alias, body=document,
+                            routing=routing,
+                        )
+            except Exception:
+                raise UnableToSaveModelToElasticSearch(
+                    'Attempted to save/update the {} related es document '
+                    'from index {}, please check your '
+                    'connection and status of your ES cluster.'.format(
+                        str(self), self.get_index_base_name()
+                    )
                 )
-            )
 
     def delete(self, *args, **kwargs):
         """
         Same as save but in reverse, remove the model instances cached
         fields in Elasticsearch.
         """
-        # We temporarily cache the model pk here so we can delete the model
-        # instance first before we remove from Elasticsearch.
-        author_document_id = self.pk
+        with instrument_es_operation(type(self), 'delete', documents=1):
+            # We temporarily cache the model pk here so we can delete the
+            # model instance first before we remove from Elasticsearch.
+            author_document_id = self.pk
 
-        super().delete(*args, **kwargs)
+            super().delete(*args, **kwargs)
 
-        try:
-            get_es_client().delete(
-                index=self.get_write_alias_name(), id=author_document_id,
-            )
-        except Exception:
-            # Catch failure and reraise with specific exception.
-            raise UnableToDeleteModelFromElasticSearch(
-                'Attempted to remove {} related es document '
-                'from index {}, please check your '
-                'connection and status of your ES cluster.'.format(
-                    str(self), self.get_index_base_name()
+            try:
+                read_alias, write_alias = self.get_es_alias_names(
+                    self.get_es_document_partition()
                 )
-            )
+                routing = self.get_es_routing()
 
-    @staticmethod
-    def get_index_mapping() -> dict:
+                # Hold writes in the spool rather than failing while the
+                # cluster is unavailable.
+                write_buffer = (
+                    get_es_degraded_spool() or get_es_write_buffer(self)
+                )
+                if write_buffer is not None:
+                    write_buffer.delete(
+                        write_alias, author_document_id, routing,
+                    )
+                else:
+                    discard_es_buffered_write(write_alias, author_document_id)
+                    get_es_client().delete(
+                        index=write_alias, id=author_document_id,
+                        routing=routing,
+                    )
+
+                if record_es_rebuild_change(type(self), author_document_id):
+                    if write_buffer is not None:
+                        write_buffer.delete(
+                            read_alias, author_document_id, routing,
+                        )
+                    else:
+                        discard_es_buffered_write(
+                            read_alias, author_document_id,
+                        )
+                        get_es_client().delete(
+                            index=read_alias, id=author_document_id,
+                            routing=routing, ignore=404,
+                        )
+            except Exception:
+                # Catch failure and reraise with specific exception.
+                raise UnableToDeleteModelFromElasticSearch(
+                    'Attempted to remove {} related es document '
+                    'from index {}, please check your '
+                    'connection and status of your ES cluster.'.format(
+                        str(self), self.get_index_base_name()
+                    )
+                )
+
+    @classmethod
+    def get_index_mapping(cls) -> dict:
         """
-        Stub mapping of how the index should be created, override this with
+        Mapping of how the index should be created, generated from the
+        types of the fields in es_cached_model_fields. Override this with
         the specific implementation of what fields should be searchable
         and how.
         """
-        return {'settings': {}, 'mappings': {}}
+        return build_index_mapping(cls)
+
+    @classmethod
+    def get_es_document_class(cls):
+        """
+        Return the read-only namedtuple representing the model's ES
+        documents, holding the pk, nominated fields kept in _source and
+        extra fields. Values are as stored, so relations hold the related
+        pk and dates are ISO strings.
+        """
+        try:
+            return es_document_classes[cls]
+        except KeyError:
+            fields = ['pk'] + [
+                field for field in cls.es_cached_model_fields
+                if field != 'pk' and field not in cls.es_source_excludes
+            ] + [
+                field_class.get_custom_field_name()
+                for field_class in cls.es_cached_extra_fields
+            ]
+            return es_document_classes.setdefault(cls, namedtuple(
+                '{}Document'.format(cls.__name__), fields,
+                defaults=[None] * len(fields),
+            ))
+
+    @classmethod
+    def get_es_partition(cls, value) -> str:
+        """
+        Return the partition documents with the es_partition_field value
+        belong to. Override along with filter_es_partition to partition
+        documents differently.
+        """
+        if isinstance(value, datetime) and timezone.is_aware(value):
+            value = timezone.localtime(value)
+
+        if isinstance(value, date):
+            return value.strftime(cls.es_partition_date_format)
+
+        return str(value)
 
     @classmethod
-    def get_read_alias_name(cls) -> str:
+    def get_es_partition_base_name(cls, partition=None) -> str:
+        """
+        Return the base of the index and alias names of a partition, the
+        index base name suffixed with the slugified partition. Partitions
+        changed by slugifying are also suffixed with a digest of their
+        value, so partitions differing only in case or punctuation aren't
+        given the same names.
+        """
+        if not partition:
+            return cls.get_index_base_name()
+
+        name = slugify(partition)
+        if name != partition:
+            name += '-' + hashlib.sha1(partition.encode()).hexdigest()[:8]
+        return cls.get_index_base_name() + '-' + name
+
+    @classmethod
+    def get_es_partitions(cls, queryset, include_indexed=False) -> List[str]:
+        """
+        Return the partitions the models within queryset belong to. Set
+        include_indexed to also include the partitions holding documents
+        in Elasticsearch, covering those whose models have all been
+        deleted.
+        """
+        field = cls._meta.get_field(cls.es_partition_field)
+        queryset = queryset.order_by()
+
+        if isinstance(field, DateField):
+            values = queryset.dates(field.name, 'day')
+        else:
+            values = queryset.values_list(field.attname, flat=True).distinct()
+
+        partitions = {cls.get_es_partition(value) for value in values}
+        if include_indexed:
+            partitions.update(cls.get_es_indexed_partitions())
+
+        return sorted(partitions)
+
+    @classmethod
+    def get_es_indexed_partitions(cls) -> set:
+        """
+        Return the partitions with an index behind the model read alias,
+        as recorded in the _meta of their mappings by generate_index.
+        """
+        try:
+            mappings = get_es_client().indices.get_mapping(
+                index=cls.get_read_alias_name()
+            )
+        except NotFoundError:
+            return set()
+
+        return {
+            mapping['mappings']['_meta']['es_partition']
+            for mapping in mappings.values()
+            if 'es_partition' in mapping['mappings'].get('_meta', {})
+        }
+
+    @classmethod
+    def filter_es_partition(cls, queryset, partition: str):
+        """
+        Filter queryset down to the models belonging to partition.
+        """
+        field = cls._meta.get_field(cls.es_partition_field)
+        if not isinstance(field, DateField):
+            return queryset.filter(**{field.attname: partition})
+
+        start = datetime.strptime(
+            partition, cls.es_partition_date_format,
+        ).date()
+        if '%d' in cls.es_partition_date_format:
+            end = start + timedelta(days=1)
+        elif '%m' in cls.es_partition_date_format:
+            end = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        else:
+            end = start.replace(year=start.year + 1)
+
+        # Compare datetimes by their date in the current time zone, as
+        # get_es_partition does.
+        lookup = field.name + (
+            '__date' if isinstance(field, DateTimeField) else ''
+        )
+        return queryset.filter(**{
+            lookup + '__gte': start, lookup + '__lt': end,
+        })
+
+    def get_es_document_partition(self):
+        """
+        Return the partition the model's document belongs to, None if the
+        model isn't partitioned.
+        """
+        if not self.es_partition_field:
+            return None
+
+        field = self._meta.get_field(self.es_partition_field)
+        return self.get_es_partition(field.value_from_object(self))
+
+    def get_es_routing(self):
+        """
+        Return the routing value of the model's document, None if the model
+        isn't routed.
+        """
+        if not self.es_routing_field:
+            return None
+
+        field = self._meta.get_field(self.es_routing_field)
+        return self.get_es_routing_value(field.value_from_object(self))
+
+    @classmethod
+    def get_es_routing_value(cls, value) -> str:
+        """
+        Return the routing of documents whose es_routing_field holds value,
+        the value as stored within the document as a string.
+        """
+        converter = cls.get_es_field_converter(
+            cls._meta.get_field(cls.es_routing_field)
+        )
+        return str(value if converter is None else converter(value))
+
+    @classmethod
+    def get_read_alias_name(cls, partition=None) -> str:
         """
         Generates a unique alias name using either set explicitly by
         overridding this method or in the default format of a
-        combination of {index_name}-read.
+        combination of {index_name}-read, or {index_name}-{partition}-read
+        for the alias of a single partition.
         """
-        return (
-            cls.get_index_base_name()
-            + '-' + cls.es_index_alias_read_postfix
-        )
+        try:
+            return es_alias_names[cls, 'read', partition]
+        except KeyError:
+            return es_alias_names.setdefault(
+                (cls, 'read', partition),
+                cls.get_es_partition_base_name(partition)
+                + '-' + cls.es_index_alias_read_postfix,
+            )
 
     @classmethod
-    def get_write_alias_name(cls) -> str:
+    def get_write_alias_name(cls, partition=None) -> str:
         """
         Generates a unique alias name using either set explicitly by
         overridding this method or in the default format of a
-        combination of {index_name}-write.
+        combination of {index_name}-write, or {index_name}-{partition}-write
+        for the alias of a single partition.
+        """
+        try:
+            return es_alias_names[cls, 'write', partition]
+        except KeyError:
+            return es_alias_names.setdefault(
+                (cls, 'write', partition),
+                cls.get_es_partition_base_name(partition)
+                + '-' + cls.es_index_alias_write_postfix,
+            )
+
+    @classmethod
+    def get_es_alias_names(cls, partition=None):
         """
+        Return the read and write alias names of the model, or of a single
+        partition when set. partition is only passed on for partitions so
+        alias name overrides not taking it keep working.
+        """
+        if partition is None:
+            return cls.get_read_alias_name(), cls.get_write_alias_name()
+
         return (
-            cls.get_index_base_name()
-            + '-' + cls.es_index_alias_write_postfix
+            cls.get_read_alias_name(partition),
+            cls.get_write_alias_name(partition),
         )
 
     @classmethod
-    def generate_index(cls) -> str:
+    def generate_index(cls, partition=None, suffix=None) -> str:
         """
         Generates a new index in Elasticsearch for the
         model returning the index name.
+
+        Index names end in a random id unless suffix is set, an index that
+        already exists with the resulting name is then taken to have been
+        generated concurrently by another process and its name returned.
         """
-        index = cls.get_index_base_name() + '-' + uuid4().hex
-        get_es_client().indices.create(
-            index=index, body=cls.get_index_mapping()
+        index = (
+            cls.get_es_partition_base_name(partition)
+            + '-' + (suffix or uuid4().hex)
         )
+        body = cls.get_index_mapping()
+        if partition:
+            # Record the partition so it can be listed from its index.
+            body = dict(body or {})
+            body['mappings'] = {
+                **body.get('mappings', {}),
+                '_meta': {'es_partition': partition},
+            }
+
+        try:
+            get_es_client().indices.create(index=index, body=body)
+        except RequestError as e:
+            if (
+                suffix is None
+                or e.error != 'resource_already_exists_exception'
+            ):
+                raise
         return index
 
     @classmethod
@@ -168,46 +517,436 @@ class ESBoundModel(Model):
         """
         Connect an alias to a specified index by default removes alias
         from any other indices if present.
+
+        Whether the alias already exists is taken from the alias cache, the
+        move is then a single atomic request removing the alias from every
+        index before adding it to the new one.
         """
-        old_indicy_names = []
-        if get_es_client().indices.exists_alias(name=alias):
-            old_indicy_names = get_index_names_from_alias(alias)
+        for attempt in range(2):
+            alias_updates = []
+            if resolve_alias_indices(alias):
+                alias_updates.append(
+                    {'remove': {'index': '*', 'alias': alias}}
+                )
+            alias_updates.append({'add': {'index': index, 'alias': alias}})
 
-        alias_updates = [
-            {'remove': {'index': indicy, 'alias': alias}}
-            for indicy in old_indicy_names
-        ]
-        alias_updates.append({'add': {'index': index, 'alias': alias}})
+            try:
+                get_es_client().indices.update_aliases(
+                    body={'actions': alias_updates}
+                )
+            except NotFoundError:
+                # The alias was removed since it was cached, resolve it
+                # again before retrying.
+                clear_es_alias_cache(alias)
+                if attempt:
+                    raise
+            else:
+                break
 
-        get_es_client().indices.update_aliases(body={'actions': alias_updates})
+        cache_alias_indices(alias, [index])
 
     @classmethod
-    def rebuild_es_index(cls, queryset=None, drop_old_index=True):
+    def rebuild_es_index(cls, queryset=None, drop_old_index=True,
+                         partition=None):
         """
         Rebuilds the entire ESIndex for the model, utilizes Aliases to
         preserve access to the old index while the new is being built.
 
         By default will rebuild the entire database table in Elasticsearch,
-        define a queryset to only rebuild a slice of this.
+        define a queryset to only rebuild a slice of this. Partitioned models
+        have each partition's index rebuilt in turn, including those left
+        without models when rebuilding the entire table, set partition to
+        only rebuild one.
 
         Set drop_old_index to False if you want to preserve the old index for
         future use, this will no longer have the aliases tied to it but will
         still be accessable through the Elasticsearch API.
+
+        Models saved or deleted while the rebuild runs are recorded and
+        re-applied to the new index before the read alias is switched, set
+        es_updated_at_field to also pick up writes made by other processes.
+        """
+        rebuild_table = queryset is None
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        if cls.es_partition_field and partition is None:
+            # Partitions left without models are emptied by a full rebuild.
+            for partition in cls.get_es_partitions(
+                queryset, include_indexed=rebuild_table,
+            ):
+                cls.rebuild_es_index(queryset, drop_old_index, partition)
+            return
+
+        if partition is not None:
+            queryset = cls.filter_es_partition(queryset, partition)
+            initialize_es_model_index(cls, partition)
+
+        with instrument_es_operation(cls, 'rebuild_es_index') as span:
+            read_alias, write_alias = cls.get_es_alias_names(partition)
+
+            clear_es_alias_cache(read_alias, write_alias)
+            old_indicy = resolve_alias_indices(read_alias)[0]
+            if partition is None:
+                new_indicy = cls.generate_index()
+            else:
+                new_indicy = cls.generate_index(partition)
+
+            high_water_mark = cls.get_es_high_water_mark(queryset)
+            changed_pks = start_es_rebuild_change_log(cls)
+
+            try:
+                cls.bind_alias(new_indicy, write_alias)
+
+                for qs_chunk in queryset_iterator(queryset):
+                    indexed = qs_chunk.reindex_into_es(partition=partition)
+                    if span:
+                        span.documents += indexed
+
+                cls.catch_up_es_index(
+                    queryset, changed_pks, high_water_mark, partition,
+                )
+                cls.bind_alias(new_indicy, read_alias)
+            finally:
+                stop_es_rebuild_change_log(cls)
+
+            if partition is not None:
+                # Swap the partition's index within the read alias spanning
+                # every partition.
+                alias = cls.get_read_alias_name()
+                get_es_client().indices.update_aliases(body={'actions': [
+                    {'remove': {'index': old_indicy, 'alias': alias}},
+                    {'add': {'index': new_indicy, 'alias': alias}},
+                ]})
+                clear_es_alias_cache(alias)
+
+            if high_water_mark is not None:
+                set_es_sync_watermark(new_indicy, high_water_mark)
+
+            if drop_old_index:
+                get_es_client().indices.delete(old_indicy)
+
+    @classmethod
+    def get_es_high_water_mark(cls, queryset):
+        """
+        Return the latest es_updated_at_field value within the queryset,
+        None if the field isn't set or the queryset is empty.
+        """
+        if not cls.es_updated_at_field:
+            return None
+
+        return queryset.aggregate(
+            high_water_mark=Max(cls.es_updated_at_field)
+        )['high_water_mark']
+
+    @classmethod
+    def catch_up_es_index(cls, queryset, changed_pks, high_water_mark=None,
+                          partition=None):
+        """
+        Incrementally apply changes made since a rebuild started to the
+        index behind the write alias, or the partition's write alias when
+        set. changed_pks is drained of the pks that are applied, rows past
+        high_water_mark are reindexed as well when es_updated_at_field is
+        set.
+        """
+        pks = set(changed_pks)
+        changed_pks.difference_update(pks)
+
+        if pks:
+            for qs_chunk in queryset_iterator(queryset.filter(pk__in=pks)):
+                qs_chunk.reindex_into_es(partition=partition)
+
+            removed_pks = pks - set(
+                cls.objects.filter(pk__in=pks).values_list('pk', flat=True)
+            )
+            if removed_pks:
+                cls.remove_es_documents(
+                    removed_pks, cls.get_es_alias_names(partition)[1],
+                )
+
+        if cls.es_updated_at_field:
+            if high_water_mark is not None:
+                queryset = queryset.filter(**{
+                    cls.es_updated_at_field + '__gte': high_water_mark
+                })
+
+            for qs_chunk in queryset_iterator(queryset):
+                qs_chunk.reindex_into_es(partition=partition)
+
+    @classmethod
+    def remove_es_documents(cls, ids, index: str):
+        """
+        Remove the documents with ids from index, ignoring any already
+        missing. Documents of routed models are matched across every shard
+        as the routing of removed rows isn't known.
+        """
+        if cls.es_routing_field:
+            get_es_client().delete_by_query(
+                index=index, body={'query': {'ids': {'values': list(ids)}}},
+            )
+            return
+
+        bulk(
+            get_es_client(),
+            [{'_id': pk, '_op_type': 'delete'} for pk in ids],
+            index=index,
+            raise_on_error=False,
+        )
+
+    @classmethod
+    def iter_es_pk_ranges(cls, queryset, index: str, chunk_size=1000):
+        """
+        Stream the pks of models within queryset a chunk at a time, yielding
+        each with a query matching the documents of index in the same pk
+        range and the number of documents it matches. Documents past the
+        last model are yielded as a final range without pks.
+        """
+        lower = None
+        for qs_chunk in queryset_iterator(queryset, chunk_size=chunk_size):
+            pks = list(qs_chunk.values_list('pk', flat=True))
+            pk_range = {'lte': pks[-1]}
+            if lower is not None:
+                pk_range['gt'] = lower
+            lower = pks[-1]
+
+            query = {'range': {'pk': pk_range}}
+            yield pks, query, get_es_client().count(
+                index=index, body={'query': query},
+            )['count']
+
+        query = (
+            {'match_all': {}} if lower is None
+            else {'range': {'pk': {'gt': lower}}}
+        )
+        yield [], query, get_es_client().count(
+            index=index, body={'query': query},
+        )['count']
+
+    @classmethod
+    def iter_es_range_differences(cls, queryset, index: str,
+                                  chunk_size=1000):
+        """
+        Compare the number of models within queryset against the number of
+        documents in index a pk range at a time, yielding the pks of the
+        models and the ids of the documents within each range whose counts
+        disagree.
+        """
+        for pks, query, count in cls.iter_es_pk_ranges(
+            queryset, index, chunk_size,
+        ):
+            if count != len(pks):
+                yield pks, [
+                    document_id
+                    for document_ids in es_document_id_iterator(
+                        index, chunk_size, query,
+                    )
+                    for document_id in document_ids
+                ]
+
+    @classmethod
+    def sync_es_index(cls, queryset=None, remove_deleted=True,
+                      partition=None):
+        """
+        Cheap alternative to rebuild_es_index, re-sends only the models whose
+        es_updated_at_field has moved on since the last successful sync and
+        records the new watermark against the index. Partitioned models have
+        each partition synced in turn, including those left without models
+        when removing deleted models, set partition to only sync one. The
+        watermark is left alone when syncing a custom queryset, models
+        outside it are still to be synced.
+
+        With remove_deleted set document counts are compared against the
+        table a pk range at a time, only diffing the ids of ranges whose
+        counts disagree to remove documents whose rows no longer exist.
         """
-        old_indicy = get_index_names_from_alias(cls.get_read_alias_name())[0]
-        new_indicy = cls.generate_index()
+        if not cls.es_updated_at_field:
+            raise ImproperlyConfigured(
+                'es_updated_at_field must be set on {} to sync its '
+                'index incrementally'.format(cls.__name__)
+            )
+
+        record_watermark = queryset is None
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        if cls.es_partition_field and partition is None:
+            for partition in cls.get_es_partitions(
+                queryset, include_indexed=remove_deleted,
+            ):
+                cls.sync_es_index(
+                    None if record_watermark else queryset,
+                    remove_deleted, partition,
+                )
+            return
+
+        if partition is not None:
+            queryset = cls.filter_es_partition(queryset, partition)
+            initialize_es_model_index(cls, partition)
+
+        write_alias = cls.get_es_alias_names(partition)[1]
+        watermark = get_es_sync_watermark(write_alias)
+        high_water_mark = cls.get_es_high_water_mark(queryset)
+
+        if high_water_mark is not None:
+            changed_queryset = queryset.filter(**{
+                cls.es_updated_at_field + '__lte': high_water_mark
+            })
+            if watermark is not None:
+                # Boundary rows are resent, reindexing is idempotent and this
+                # catches rows committed late sharing the watermark value.
+                changed_queryset = changed_queryset.filter(**{
+                    cls.es_updated_at_field + '__gte': watermark
+                })
+
+            for qs_chunk in queryset_iterator(changed_queryset):
+                qs_chunk.reindex_into_es(partition=partition)
+
+        if remove_deleted:
+            models = cls.objects.all()
+            if partition is not None:
+                models = cls.filter_es_partition(models, partition)
+
+            for pks, document_ids in cls.iter_es_range_differences(
+                models, write_alias,
+            ):
+                removed_ids = set(document_ids) - {str(pk) for pk in pks}
+                if removed_ids:
+                    cls.remove_es_documents(removed_ids, write_alias)
+
+        if record_watermark and high_water_mark is not None:
+            set_es_sync_watermark(write_alias, high_water_mark)
+
+    @classmethod
+    def check_es_index(cls, queryset=None, repair=False, chunk_size=1000,
+                       partition=None, compare_documents=False):
+        """
+        Stream the table and the index behind the read alias side by side a
+        pk range at a time, returning the ids of documents missing from the
+        index, stale within it or extra to it. Only the ids of ranges whose
+        model and document counts disagree are compared, so a range missing
+        one document and holding one extra goes unnoticed. Partitioned
+        models have each partition checked in turn, including those left
+        without models, set partition to only check one.
+
+        Set compare_documents to also fetch the documents of every range
+        and compare them with their models, finding stale documents. Only
+        es_cached_model_fields kept in _source are compared as extra fields
+        aren't guaranteed to be deterministic. Set repair to reindex missing
+        and stale models and remove extra documents as they are found.
+        """
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        report = {'missing': [], 'stale': [], 'extra': []}
+
+        if cls.es_partition_field and partition is None:
+            for partition in cls.get_es_partitions(
+                queryset, include_indexed=True,
+            ):
+                partition_report = cls.check_es_index(
+                    queryset, repair, chunk_size, partition,
+                    compare_documents,
+                )
+                for key, ids in partition_report.items():
+                    report[key].extend(ids)
+            return report
+
+        if partition is not None:
+            queryset = cls.filter_es_partition(queryset, partition)
+
+        read_alias, write_alias = cls.get_es_alias_names(partition)
+        indicy = get_index_names_from_alias(read_alias)[0]
+        # Fields excluded from _source can't be read back to compare.
+        fields = [
+            f for f in cls.es_cached_model_fields
+            if f != 'pk' and f not in cls.es_source_excludes
+        ]
 
-        cls.bind_alias(new_indicy, cls.get_write_alias_name())
+        for pks, query, count in cls.iter_es_pk_ranges(
+            queryset, indicy, chunk_size,
+        ):
+            missing_ids, stale_ids, extra_ids = [], [], []
 
-        chunked_qs_generator = queryset_iterator(queryset or cls.objects.all())
+            if compare_documents and pks:
+                missing_ids, stale_ids = cls.compare_es_documents(
+                    queryset.filter(pk__in=pks), indicy, fields,
+                )
+
+            if count != len(pks) - len(missing_ids):
+                document_ids = {
+                    document_id
+                    for document_ids in es_document_id_iterator(
+                        indicy, chunk_size, query,
+                    )
+                    for document_id in document_ids
+                }
+                model_ids = {str(pk) for pk in pks}
+                if not compare_documents:
+                    missing_ids = [
+                        str(pk) for pk in pks
+                        if str(pk) not in document_ids
+                    ]
+                existing_ids = {
+                    str(pk) for pk in cls.objects
+                    .filter(pk__in=document_ids - model_ids)
+                    .values_list('pk', flat=True)
+                }
+                extra_ids = sorted(
+                    document_ids - model_ids - existing_ids, key=str,
+                )
 
-        for qs_chunk in chunked_qs_generator:
-            qs_chunk.reindex_into_es()
+            report['missing'].extend(missing_ids)
+            report['stale'].extend(stale_ids)
+            report['extra'].extend(extra_ids)
 
-        cls.bind_alias(new_indicy, cls.get_read_alias_name())
+            if repair and (missing_ids or stale_ids):
+                (
+                    queryset
+                    .filter(pk__in=missing_ids + stale_ids)
+                    .reindex_into_es(partition=partition)
+                )
+            if repair and extra_ids:
+                cls.remove_es_documents(extra_ids, write_alias)
 
-        if drop_old_index:
-            get_es_client().indices.delete(old_indicy)
+        return report
+
+    @classmethod
+    def compare_es_documents(cls, queryset, index: str, fields: List[str]):
+        """
+        Fetch the documents of the models within queryset from index,
+        returning the ids of those missing and of those whose fields differ
+        from their model.
+        """
+        db_documents = build_documents_from_queryset(
+            queryset, include_extra_fields=False,
+        )
+        requested_documents = []
+        for pk, document in db_documents.items():
+            requested_document = {'_id': str(pk)}
+            if '_routing' in document:
+                requested_document['routing'] = document['_routing']
+            requested_documents.append(requested_document)
+
+        es_documents = {
+            document['_id']: document.get('_source', {})
+            for document in get_es_client().mget(
+                index=index, body={'docs': requested_documents},
+                _source_includes=fields,
+            )['docs']
+            if document['found']
+        }
+
+        missing_ids, stale_ids = [], []
+        for pk, document in db_documents.items():
+            source = {
+                k: v for k, v in document['_source'].items() if k in fields
+            }
+            if str(pk) not in es_documents:
+                missing_ids.append(str(pk))
+            elif es_documents[str(pk)] != source:
+                stale_ids.append(str(pk))
+
+        return missing_ids, stale_ids
 
     def retrive_es_fields(self, only_include_fields=True):
         """
@@ -215,7 +954,11 @@ class ESBoundModel(Model):
         """
         try:
             results = get_es_client().get(
-                id=self.pk, index=self.get_read_alias_name(),
+                id=self.pk,
+                index=self.get_es_alias_names(
+                    self.get_es_document_partition()
+                )[0],
+                routing=self.get_es_routing(),
             )
         except NotFoundError:
             raise ElasticSearchFailure(
@@ -228,3 +971,45 @@ class ESBoundModel(Model):
             return results['_source']
 
         return results
+
+
+@receiver(class_prepared)
+def validate_es_routing_field(sender, **kwargs):
+    """
+    Ensure the routing field of ESBoundModels is nominated, its value is
+    otherwise missing from documents indexed in bulk.
+    """
+    if (
+        issubclass(sender, ESBoundModel)
+        and sender.es_routing_field
+        and sender.es_routing_field not in sender.es_cached_model_fields
+    ):
+        raise ImproperlyConfigured(
+            'es_routing_field {} of {} must be one of its '
+            'es_cached_model_fields'.format(
+                sender.es_routing_field, sender.__name__,
+            )
+        )
+
+
+@receiver(class_prepared)
+def validate_es_partition_date_format(sender, **kwargs):
+    """
+    Ensure the date partitions of ESBoundModels are whole years, months
+    or days, the only buckets filter_es_partition can select.
+    """
+    if not (issubclass(sender, ESBoundModel) and sender.es_partition_field):
+        return
+
+    field = sender._meta.get_field(sender.es_partition_field)
+    directives = set(re.findall('%.', sender.es_partition_date_format))
+    directives.discard('%%')
+    if isinstance(field, DateField) and directives not in (
+        {'%Y'}, {'%Y', '%m'}, {'%Y', '%m', '%d'},
+    ):
+        raise ImproperlyConfigured(
+            'es_partition_date_format {} of {} may only use the %Y, %m '
+            'and %d directives, from the year down'.format(
+                sender.es_partition_date_format, sender.__name__,
+            )
+        )
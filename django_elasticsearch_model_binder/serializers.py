@@ -0,0 +1,41 @@
+from django.core.exceptions import ImproperlyConfigured
+from elasticsearch.exceptions import SerializationError
+from elasticsearch.serializer import JSONSerializer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonSerializer(JSONSerializer):
+    """
+    Elasticsearch serializer backed by orjson, datetimes, dates and UUIDs
+    are encoded natively with anything else falling back to the default
+    json serializer conversions. Select with DJANGO_ES_MODEL_SERIALIZER.
+    """
+
+    def __init__(self):
+        if orjson is None:
+            raise ImproperlyConfigured(
+                'orjson must be installed to use OrjsonSerializer'
+            )
+
+    def loads(self, s):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        # Bulk helpers pass through already serialized actions.
+        if isinstance(data, str):
+            return data
+
+        try:
+            return orjson.dumps(
+                data, default=self.default,
+                option=orjson.OPT_NON_STR_KEYS,
+            ).decode('utf-8')
+        except TypeError as e:
+            raise SerializationError(data, e)
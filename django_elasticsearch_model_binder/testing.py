@@ -0,0 +1,906 @@
+import json
+import re
+from contextlib import contextmanager
+from fnmatch import fnmatchcase
+from itertools import count
+from threading import RLock
+from time import sleep
+from urllib.parse import unquote
+
+from elasticsearch import Connection
+
+from django_elasticsearch_model_binder.instrumentation import (
+    ESOperationSpan, measure_es_span,
+)
+
+
+class FakeElasticsearchError(Exception):
+    """
+    Raised within the fake cluster, rendered as an Elasticsearch error
+    response by FakeElasticsearchConnection.
+    """
+
+    def __init__(self, status, error_type, reason='', body=None):
+        super().__init__(reason or error_type)
+        self.status = status
+        self.body = body or {
+            'error': {'type': error_type, 'reason': reason},
+            'status': status,
+        }
+
+
+def tokenize(value) -> list:
+    """
+    Crude stand in for the standard analyzer, lowercased word tokens.
+    """
+    return re.findall(r'\w+', str(value).lower())
+
+
+def get_source_value(source: dict, field: str):
+    """
+    Resolve a dotted field path within a document source, keyword
+    sub-fields resolve to the value of their parent field.
+    """
+    if field.endswith('.keyword'):
+        field = field[:-len('.keyword')]
+
+    value = source
+    for part in field.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def as_list(value) -> list:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+class FakeElasticsearchCluster:
+    """
+    In-memory Elasticsearch stand in supporting the subset of the REST API
+    used by the binder: index creation, aliases, mappings, document index,
+    get, mget, delete and bulk, along with searches, counts and deletes by
+    query using ids, term(s), prefix, match, range, exists and bool queries.
+
+    Text is matched on lowercased word tokens and keyword sub-fields on the
+    exact value, there is no scoring and every write is immediately visible.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.indices = {}
+            self.scrolls = {}
+            self.request_count = 0
+            self._ids = count(1)
+
+    def handle(self, method, path, params, body):
+        """
+        Route a request returning the status and response body.
+        """
+        with self._lock:
+            self.request_count += 1
+            parts = [unquote(p) for p in path.split('?')[0].split('/') if p]
+            params = {
+                key: value.decode('utf-8') if isinstance(value, bytes)
+                else value
+                for key, value in (params or {}).items()
+            }
+            return self._route(method, parts, params, body)
+
+    # Routing
+
+    def _route(self, method, parts, params, body):
+        if not parts:
+            return 200, {
+                'name': 'fake', 'cluster_name': 'fake',
+                'version': {'number': '7.17.0', 'build_flavor': 'default'},
+                'tagline': 'You Know, for Search',
+            }
+
+        if parts[0] == '_bulk':
+            return self.bulk(None, body)
+        if parts[0] == '_aliases':
+            return self.update_aliases(json.loads(body))
+        if parts[0] == '_alias':
+            return self.get_alias(None, parts[1] if len(parts) > 1 else None)
+        if parts[0] == '_refresh':
+            return 200, {'_shards': {'total': 1, 'successful': 1}}
+        if parts[:2] == ['_search', 'scroll']:
+            return self.scroll(method, params, body)
+        if parts[0] in ('_search', '_count', '_mget'):
+            parts = ['_all'] + parts
+
+        target, endpoint = parts[0], parts[1:]
+        if not endpoint:
+            if method == 'PUT':
+                return self.create_index(target, body)
+            if method == 'DELETE':
+                return self.delete_index(target)
+            return self.get_index(target)
+
+        name = endpoint[0]
+        if name == '_doc' and len(endpoint) > 1 and endpoint[1] == '_bulk':
+            name, endpoint = '_bulk', endpoint[1:]
+
+        if name == '_doc':
+            doc_id = endpoint[1] if len(endpoint) > 1 else None
+            if method in ('PUT', 'POST'):
+                return self.index_document(target, doc_id, json.loads(body))
+            if method == 'DELETE':
+                return self.delete_document(target, doc_id)
+            return self.get_document(target, doc_id, params)
+        if name == '_bulk':
+            return self.bulk(target, body)
+        if name == '_search':
+            return self.search(target, params, body)
+        if name == '_count':
+            return self.count(target, body)
+        if name == '_delete_by_query':
+            return self.delete_by_query(target, body)
+        if name == '_mget':
+            return self.mget(target, params, body)
+        if name in ('_alias', '_aliases'):
+            if method == 'DELETE':
+                return self.update_aliases({'actions': [
+                    {'remove': {'index': target, 'alias': endpoint[1]}},
+                ]})
+            return self.get_alias(target, endpoint[1])
+        if name == '_mapping':
+            if method == 'PUT':
+                return self.put_mapping(target, json.loads(body))
+            return self.get_mapping(target)
+        if name == '_refresh':
+            return 200, {'_shards': {'total': 1, 'successful': 1}}
+
+        raise FakeElasticsearchError(
+            400, 'unsupported_operation_exception',
+            '{} /{} is not supported'.format(method, '/'.join(parts)),
+        )
+
+    # Name resolution
+
+    def _aliases(self):
+        aliases = {}
+        for index, data in self.indices.items():
+            for alias in data['aliases']:
+                aliases.setdefault(alias, []).append(index)
+        return aliases
+
+    def resolve(self, target, allow_missing=False) -> list:
+        """
+        Resolve a comma separated list of index names, aliases or wildcard
+        patterns to the concrete indices they cover.
+        """
+        aliases = self._aliases()
+        resolved = []
+        for name in (target or '_all').split(','):
+            if name in ('_all', '*'):
+                matches = list(self.indices)
+            elif '*' in name:
+                matches = [i for i in self.indices if fnmatchcase(i, name)]
+                for alias, indices in aliases.items():
+                    if fnmatchcase(alias, name):
+                        matches.extend(indices)
+            elif name in self.indices:
+                matches = [name]
+            elif name in aliases:
+                matches = aliases[name]
+            elif allow_missing:
+                matches = []
+            else:
+                raise FakeElasticsearchError(
+                    404, 'index_not_found_exception',
+                    'no such index [{}]'.format(name),
+                )
+            resolved.extend(i for i in matches if i not in resolved)
+        return resolved
+
+    def resolve_write_index(self, target) -> str:
+        if target in self.indices:
+            return target
+
+        indices = self._aliases().get(target)
+        if not indices:
+            raise FakeElasticsearchError(
+                404, 'index_not_found_exception',
+                'no such index [{}]'.format(target),
+            )
+        if len(indices) > 1:
+            raise FakeElasticsearchError(
+                400, 'illegal_argument_exception',
+                'no write index is defined for alias [{}]'.format(target),
+            )
+        return indices[0]
+
+    # Indices
+
+    def create_index(self, name, body):
+        if name in self.indices:
+            raise FakeElasticsearchError(
+                400, 'resource_already_exists_exception',
+                'index [{}] already exists'.format(name),
+            )
+
+        body = json.loads(body) if body else {}
+        self.indices[name] = {
+            'settings': body.get('settings') or {},
+            'mappings': body.get('mappings') or {},
+            'aliases': dict(body.get('aliases') or {}),
+            'documents': {},
+        }
+        return 200, {'acknowledged': True, 'index': name}
+
+    def delete_index(self, target):
+        for index in self.resolve(target):
+            del self.indices[index]
+        return 200, {'acknowledged': True}
+
+    def get_index(self, target):
+        return 200, {
+            index: {
+                'aliases': self.indices[index]['aliases'],
+                'mappings': self.indices[index]['mappings'],
+                'settings': self.indices[index]['settings'],
+            }
+            for index in self.resolve(target)
+        }
+
+    def get_alias(self, target, name):
+        indices = self.resolve(target, allow_missing=target is None)
+        names = name.split(',') if name else None
+        result = {}
+        for index in indices:
+            aliases = {
+                alias: {} for alias in self.indices[index]['aliases']
+                if names is None or any(fnmatchcase(alias, n) for n in names)
+            }
+            if aliases or names is None:
+                result[index] = {'aliases': aliases}
+
+        if not result:
+            raise FakeElasticsearchError(
+                404, 'aliases_not_found_exception',
+                'alias [{}] missing'.format(name),
+                body={'error': 'alias [{}] missing'.format(name),
+                      'status': 404},
+            )
+        return 200, result
+
+    def update_aliases(self, body):
+        for action in body.get('actions', []):
+            (action_type, options), = action.items()
+            indices = []
+            for index in as_list(options.get('index')) + as_list(
+                options.get('indices')
+            ):
+                indices.extend(self.resolve(index))
+            aliases = as_list(options.get('alias')) + as_list(
+                options.get('aliases')
+            )
+
+            if action_type == 'add':
+                for index in indices:
+                    for alias in aliases:
+                        self.indices[index]['aliases'][alias] = {}
+            elif action_type == 'remove':
+                removed = False
+                for index in indices:
+                    for alias in list(self.indices[index]['aliases']):
+                        if any(fnmatchcase(alias, a) for a in aliases):
+                            del self.indices[index]['aliases'][alias]
+                            removed = True
+                if not removed:
+                    raise FakeElasticsearchError(
+                        404, 'aliases_not_found_exception',
+                        'aliases {} missing'.format(aliases),
+                    )
+            elif action_type == 'remove_index':
+                for index in indices:
+                    del self.indices[index]
+            else:
+                raise FakeElasticsearchError(
+                    400, 'illegal_argument_exception',
+                    'unsupported alias action [{}]'.format(action_type),
+                )
+
+        return 200, {'acknowledged': True}
+
+    def get_mapping(self, target):
+        return 200, {
+            index: {'mappings': self.indices[index]['mappings']}
+            for index in self.resolve(target)
+        }
+
+    def put_mapping(self, target, body):
+        for index in self.resolve(target):
+            mappings = self.indices[index]['mappings']
+            for key, value in body.items():
+                if key == 'properties':
+                    mappings.setdefault('properties', {}).update(value)
+                else:
+                    mappings[key] = value
+        return 200, {'acknowledged': True}
+
+    # Documents
+
+    def _document_response(self, index, doc_id, document=None):
+        response = {'_index': index, '_type': '_doc', '_id': doc_id}
+        if document is None:
+            response['found'] = False
+        else:
+            response.update(
+                _version=document['_version'], _seq_no=document['_seq_no'],
+                _primary_term=1, found=True, _source=document['_source'],
+            )
+        return response
+
+    def _index(self, target, doc_id, source):
+        index = self.resolve_write_index(target)
+        doc_id = str(doc_id) if doc_id is not None else str(next(self._ids))
+        documents = self.indices[index]['documents']
+        existing = documents.get(doc_id)
+        documents[doc_id] = {
+            '_source': source,
+            '_version': existing['_version'] + 1 if existing else 1,
+            '_seq_no': next(self._ids),
+        }
+        return 201 if existing is None else 200, {
+            '_index': index, '_type': '_doc', '_id': doc_id,
+            '_version': documents[doc_id]['_version'],
+            'result': 'created' if existing is None else 'updated',
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+        }
+
+    def _delete(self, target, doc_id):
+        index = self.resolve_write_index(target)
+        document = self.indices[index]['documents'].pop(str(doc_id), None)
+        return 200 if document else 404, {
+            '_index': index, '_type': '_doc', '_id': str(doc_id),
+            'result': 'deleted' if document else 'not_found',
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+        }
+
+    def index_document(self, target, doc_id, source):
+        return self._index(target, doc_id, source)
+
+    def delete_document(self, target, doc_id):
+        return self._delete(target, doc_id)
+
+    def get_document(self, target, doc_id, params):
+        indices = self.resolve(target)
+        for index in indices:
+            document = self.indices[index]['documents'].get(str(doc_id))
+            if document is not None:
+                response = self._document_response(index, doc_id, document)
+                response['_source'] = self._filter_source(
+                    index, document['_source'], params, None,
+                )
+                return 200, response
+        return 404, self._document_response(
+            indices[0] if indices else target, doc_id,
+        )
+
+    def mget(self, target, params, body):
+        body = json.loads(body)
+        requested = [
+            (doc.get('_index', target), doc['_id'])
+            for doc in body.get('docs', [])
+        ] + [(target, doc_id) for doc_id in body.get('ids', [])]
+
+        docs = []
+        for index_target, doc_id in requested:
+            status, document = self.get_document(index_target, doc_id, params)
+            docs.append(document)
+        return 200, {'docs': docs}
+
+    def bulk(self, target, body):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        lines = iter(line for line in body.split('\n') if line.strip())
+
+        items = []
+        for line in lines:
+            (action, metadata), = json.loads(line).items()
+            index = metadata.get('_index', target)
+            doc_id = metadata.get('_id')
+            try:
+                if action in ('index', 'create'):
+                    status, result = self._index(
+                        index, doc_id, json.loads(next(lines)),
+                    )
+                elif action == 'update':
+                    update = json.loads(next(lines))
+                    write_index = self.resolve_write_index(index)
+                    existing = (
+                        self.indices[write_index]['documents'].get(str(doc_id))
+                    )
+                    if existing is None and 'upsert' not in update:
+                        raise FakeElasticsearchError(
+                            404, 'document_missing_exception',
+                            '[{}]: document missing'.format(doc_id),
+                        )
+                    source = dict(
+                        existing['_source'] if existing
+                        else update['upsert']
+                    )
+                    source.update(update.get('doc', {}))
+                    status, result = self._index(index, doc_id, source)
+                elif action == 'delete':
+                    status, result = self._delete(index, doc_id)
+                else:
+                    raise FakeElasticsearchError(
+                        400, 'illegal_argument_exception',
+                        'unknown bulk action [{}]'.format(action),
+                    )
+            except FakeElasticsearchError as e:
+                status = e.status
+                result = {
+                    '_index': index, '_id': doc_id, 'error': e.body['error'],
+                }
+            result['status'] = status
+            items.append({action: result})
+
+        return 200, {
+            'took': 0,
+            'errors': any('error' in next(iter(i.values())) for i in items),
+            'items': items,
+        }
+
+    # Search
+
+    def _filter_source(self, index, source, params, body_source):
+        # Fields excluded from _source by the mapping are indexed but never
+        # returned.
+        excludes = (
+            self.indices[index]['mappings'].get('_source', {})
+            .get('excludes', [])
+        )
+        if excludes:
+            source = {
+                key: value for key, value in source.items()
+                if not any(fnmatchcase(key, pattern) for pattern in excludes)
+            }
+
+        includes = params.get('_source_includes') or params.get('_source')
+        if body_source is not None:
+            includes = body_source
+        if includes in (False, 'false'):
+            return None
+        if includes in (None, True, 'true'):
+            return source
+        if isinstance(includes, dict):
+            includes = includes.get('includes')
+        if isinstance(includes, str):
+            includes = includes.split(',')
+        if not includes:
+            return source
+        return {
+            key: value for key, value in source.items()
+            if any(fnmatchcase(key, pattern) for pattern in includes)
+        }
+
+    def matches(self, doc_id, source, query) -> bool:
+        """
+        Evaluate a query against a single document.
+        """
+        if not query:
+            return True
+
+        (query_type, options), = query.items()
+        if query_type == 'match_all':
+            return True
+        if query_type == 'match_none':
+            return False
+        if query_type == 'ids':
+            return doc_id in [str(v) for v in options.get('values', [])]
+        if query_type == 'bool':
+            must = as_list(options.get('must')) + as_list(
+                options.get('filter')
+            )
+            should = as_list(options.get('should'))
+            must_not = as_list(options.get('must_not'))
+            minimum_should_match = options.get(
+                'minimum_should_match', 0 if must else 1
+            )
+            return (
+                all(self.matches(doc_id, source, q) for q in must)
+                and not any(self.matches(doc_id, source, q) for q in must_not)
+                and (
+                    not should or sum(
+                        self.matches(doc_id, source, q) for q in should
+                    ) >= minimum_should_match
+                )
+            )
+        if query_type == 'exists':
+            return get_source_value(source, options['field']) is not None
+
+        (field, value), = options.items()
+        if field == '_id':
+            values = [doc_id]
+        else:
+            values = as_list(get_source_value(source, field))
+        exact = field.endswith('.keyword') or field == '_id'
+
+        if query_type in ('term', 'terms'):
+            if query_type == 'term':
+                terms = [value['value'] if isinstance(value, dict) else value]
+            else:
+                terms = value
+            for v in values:
+                candidates = (
+                    [v] if exact or not isinstance(v, str) else tokenize(v)
+                )
+                if any(
+                    c == t or str(c) == str(t)
+                    for c in candidates for t in terms
+                ):
+                    return True
+            return False
+        if query_type == 'prefix':
+            prefix = value['value'] if isinstance(value, dict) else value
+            for v in values:
+                candidates = [str(v)] if exact else tokenize(v)
+                if any(c.startswith(
+                    str(prefix) if exact else str(prefix).lower()
+                ) for c in candidates):
+                    return True
+            return False
+        if query_type == 'match':
+            query_text = value['query'] if isinstance(value, dict) else value
+            query_tokens = set(tokenize(query_text))
+            return any(
+                query_tokens & set(tokenize(v)) for v in values
+            )
+        if query_type == 'range':
+            bounds = {
+                'gt': lambda a, b: a > b, 'gte': lambda a, b: a >= b,
+                'lt': lambda a, b: a < b, 'lte': lambda a, b: a <= b,
+            }
+            return any(
+                all(
+                    bounds[op](v, bound)
+                    for op, bound in value.items() if op in bounds
+                )
+                for v in values if v is not None
+            )
+
+        raise FakeElasticsearchError(
+            400, 'parsing_exception',
+            'unsupported query [{}]'.format(query_type),
+        )
+
+    def _matching_hits(self, target, query):
+        hits = []
+        for index in self.resolve(target, allow_missing=True):
+            for doc_id, document in self.indices[index]['documents'].items():
+                if self.matches(doc_id, document['_source'], query):
+                    hits.append((index, doc_id, document['_source']))
+        return hits
+
+    def _sort_hits(self, hits, sort):
+        sort_keys = []
+        for spec in as_list(sort) if sort else []:
+            if isinstance(spec, str):
+                field, options = spec, {}
+            else:
+                (field, options), = spec.items()
+                if isinstance(options, str):
+                    options = {'order': options}
+            if field in ('_doc', '_score'):
+                continue
+            sort_keys.append((field, options))
+
+        def value_of(hit, field):
+            if field == '_id':
+                return hit[1]
+            value = get_source_value(hit[2], field)
+            return min(value) if isinstance(value, list) and value else value
+
+        for field, options in reversed(sort_keys):
+            present = [h for h in hits if value_of(h, field) is not None]
+            missing = [h for h in hits if value_of(h, field) is None]
+            present.sort(
+                key=lambda h: value_of(h, field),
+                reverse=options.get('order', 'asc') == 'desc',
+            )
+            if options.get('missing') == '_first':
+                hits = missing + present
+            else:
+                hits = present + missing
+
+        return hits, [field for field, _ in sort_keys]
+
+    def _render_hits(self, hits, sort_fields, params, body_source):
+        rendered = []
+        for index, doc_id, source in hits:
+            hit = {
+                '_index': index, '_type': '_doc', '_id': doc_id,
+                '_score': None if sort_fields else 1.0,
+            }
+            filtered_source = self._filter_source(
+                index, source, params, body_source,
+            )
+            if filtered_source is not None:
+                hit['_source'] = filtered_source
+            if sort_fields:
+                hit['sort'] = [
+                    doc_id if f == '_id' else get_source_value(source, f)
+                    for f in sort_fields
+                ]
+            rendered.append(hit)
+        return rendered
+
+    def search(self, target, params, body):
+        body = json.loads(body) if body else {}
+        hits = self._matching_hits(target, body.get('query'))
+        hits, sort_fields = self._sort_hits(hits, body.get('sort'))
+        total = len(hits)
+
+        size = int(params.get('size', body.get('size', 10)))
+        offset = int(params.get('from', body.get('from', 0)))
+
+        response = {
+            'took': 0, 'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'hits': {
+                'total': {'value': total, 'relation': 'eq'},
+                'max_score': None if sort_fields or not total else 1.0,
+            },
+        }
+
+        if 'scroll' in params:
+            scroll_id = 'scroll-{}'.format(next(self._ids))
+            self.scrolls[scroll_id] = {
+                'hits': hits[size:], 'size': size, 'params': params,
+                'source': body.get('_source'), 'sort_fields': sort_fields,
+            }
+            response['_scroll_id'] = scroll_id
+            page = hits[:size]
+        else:
+            page = hits[offset:offset + size]
+
+        response['hits']['hits'] = self._render_hits(
+            page, sort_fields, params, body.get('_source'),
+        )
+
+        aggregations = body.get('aggs') or body.get('aggregations')
+        if aggregations:
+            response['aggregations'] = self.aggregate(hits, aggregations)
+
+        return 200, response
+
+    def scroll(self, method, params, body):
+        body = json.loads(body) if body else {}
+        scroll_ids = as_list(body.get('scroll_id') or params.get('scroll_id'))
+
+        if method == 'DELETE':
+            for scroll_id in scroll_ids:
+                self.scrolls.pop(scroll_id, None)
+            return 200, {'succeeded': True, 'num_freed': len(scroll_ids)}
+
+        scroll_id = scroll_ids[0]
+        if scroll_id not in self.scrolls:
+            raise FakeElasticsearchError(
+                404, 'search_context_missing_exception',
+                'No search context found for id [{}]'.format(scroll_id),
+            )
+
+        scroll = self.scrolls[scroll_id]
+        page = scroll['hits'][:scroll['size']]
+        scroll['hits'] = scroll['hits'][scroll['size']:]
+        return 200, {
+            '_scroll_id': scroll_id, 'took': 0, 'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'hits': {'hits': self._render_hits(
+                page, scroll['sort_fields'], scroll['params'],
+                scroll['source'],
+            )},
+        }
+
+    def _field_type(self, index, field):
+        """
+        Return the mapped type of a dotted field path within an index,
+        keyword sub-fields are keywords.
+        """
+        if field.endswith('.keyword'):
+            return 'keyword'
+
+        mapping = self.indices[index]['mappings']
+        for part in field.split('.'):
+            mapping = mapping.get('properties', {}).get(part)
+            if mapping is None:
+                return None
+        return mapping.get('type')
+
+    def aggregate(self, hits, aggregations) -> dict:
+        """
+        Compute terms, histogram, stats, value_count, min, max, avg and sum
+        aggregations over matched hits, bucket aggregations may nest others.
+        """
+        results = {}
+        for name, aggregation in aggregations.items():
+            sub_aggregations = (
+                aggregation.get('aggs') or aggregation.get('aggregations')
+            )
+            (agg_type, options), = (
+                (k, v) for k, v in aggregation.items()
+                if k not in ('aggs', 'aggregations')
+            )
+            values = [
+                (hit, value) for hit in hits for value in as_list(
+                    get_source_value(hit[2], options['field'])
+                )
+            ]
+
+            if agg_type in ('terms', 'histogram'):
+                buckets = {}
+                for hit, value in values:
+                    if agg_type == 'histogram':
+                        interval = options['interval']
+                        value = float(value // interval * interval)
+                    elif self._field_type(hit[0], options['field']) == (
+                        'keyword'
+                    ):
+                        # Keyword terms are keyed by their string value.
+                        value = str(value)
+                    bucket_hits = buckets.setdefault(value, [])
+                    if hit not in bucket_hits:
+                        bucket_hits.append(hit)
+
+                if agg_type == 'terms':
+                    keys = sorted(
+                        buckets, key=lambda k: (-len(buckets[k]), str(k)),
+                    )[:options.get('size', 10)]
+                else:
+                    keys = sorted(buckets)
+
+                rendered = []
+                for key in keys:
+                    bucket = {'key': key, 'doc_count': len(buckets[key])}
+                    if sub_aggregations:
+                        bucket.update(
+                            self.aggregate(buckets[key], sub_aggregations)
+                        )
+                    rendered.append(bucket)
+
+                results[name] = {'buckets': rendered}
+                if agg_type == 'terms':
+                    results[name].update(
+                        doc_count_error_upper_bound=0,
+                        sum_other_doc_count=sum(
+                            len(buckets[k]) for k in buckets if k not in keys
+                        ),
+                    )
+                continue
+
+            numbers = [value for _, value in values]
+            stats = {
+                'count': len(numbers),
+                'min': min(numbers) if numbers else None,
+                'max': max(numbers) if numbers else None,
+                'avg': sum(numbers) / len(numbers) if numbers else None,
+                'sum': sum(numbers),
+            }
+            if agg_type == 'stats':
+                results[name] = stats
+            elif agg_type == 'value_count':
+                results[name] = {'value': stats['count']}
+            elif agg_type in ('min', 'max', 'avg', 'sum'):
+                results[name] = {'value': stats[agg_type]}
+            else:
+                raise FakeElasticsearchError(
+                    400, 'parsing_exception',
+                    'unsupported aggregation [{}]'.format(agg_type),
+                )
+
+        return results
+
+    def count(self, target, body):
+        body = json.loads(body) if body else {}
+        return 200, {
+            'count': len(self._matching_hits(target, body.get('query'))),
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+        }
+
+    def delete_by_query(self, target, body):
+        body = json.loads(body) if body else {}
+        hits = self._matching_hits(target, body.get('query'))
+        for index, doc_id, _ in hits:
+            self.indices[index]['documents'].pop(doc_id)
+        return 200, {
+            'took': 0, 'timed_out': False, 'total': len(hits),
+            'deleted': len(hits), 'failures': [],
+        }
+
+
+# Cluster shared by every fake connection in the process.
+fake_cluster = FakeElasticsearchCluster()
+
+
+class FakeElasticsearchConnection(Connection):
+    """
+    Connection serving requests from the in-process fake_cluster, select
+    by setting connection_class within DJANGO_ES_MODEL_CONFIG. Pass latency
+    in seconds alongside it to simulate the transport round trip.
+    """
+
+    def __init__(self, latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        if self.latency:
+            sleep(self.latency)
+
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+
+        try:
+            status, response = fake_cluster.handle(method, url, params, body)
+        except FakeElasticsearchError as e:
+            status, response = e.status, e.body
+
+        raw_data = json.dumps(response)
+        if not (200 <= status < 300) and status not in ignore:
+            self._raise_error(status, raw_data)
+
+        return status, {
+            'content-type': 'application/json',
+            'x-elastic-product': 'Elasticsearch',
+        }, raw_data
+
+
+class ESRoundTripBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def es_round_trip_budget(db_queries=None, es_requests=None, label='block'):
+    """
+    Count the DB queries and ES requests made within the block, raising
+    ESRoundTripBudgetExceeded on exit if either exceeds its budget. Leave a
+    budget as None to only count it. ES requests are counted by the
+    transport of the client from get_es_client, so aren't seen when a
+    custom transport_class is configured.
+
+    Yields the span holding the counts taken.
+    """
+    span = ESOperationSpan(None, label)
+    with measure_es_span(span):
+        yield span
+
+    exceeded = [
+        '{} {} made, budget is {}'.format(count, name, budget)
+        for name, count, budget in (
+            ('DB queries', span.db_queries, db_queries),
+            ('ES requests', span.es_requests, es_requests),
+        )
+        if budget is not None and count > budget
+    ]
+    if exceeded:
+        raise ESRoundTripBudgetExceeded(
+            '{} exceeded its round trip budget: {}'.format(
+                label, ', '.join(exceeded),
+            )
+        )
+
+
+class ESRoundTripBudgetMixin:
+    """
+    TestCase mixin asserting binder operations stay within a fixed number
+    of DB queries and ES requests.
+    """
+
+    def assertESRoundTrips(self, db_queries=None, es_requests=None,
+                           label='block'):
+        return es_round_trip_budget(
+            db_queries=db_queries, es_requests=es_requests, label=label,
+        )
@@ -1,15 +1,42 @@
-from typing import Dict, List, Any
+import gzip
+import logging
+import os
+from datetime import date, datetime
+from itertools import islice
+from threading import Thread
+from time import monotonic
+from typing import Callable, Dict, Iterator, List, Any, Optional
 
 from django.conf import settings
 from django.core.exceptions import (
-    ImproperlyConfigured, ObjectDoesNotExist, FieldError,
+    FieldDoesNotExist, ImproperlyConfigured, ObjectDoesNotExist, FieldError,
 )
+from django.core.signals import setting_changed
+from django.db import models
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.module_loading import import_string
 from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import NotFoundError
+from elasticsearch.helpers import scan
 
+from django_elasticsearch_model_binder.circuit import (
+    ES_OUTAGE_STATUSES, CircuitBreakerTransport, es_write_spool_pending,
+    get_es_circuit_breaker,
+)
 from django_elasticsearch_model_binder.exceptions import (
+    ElasticSearchCircuitOpen, ElasticSearchFailure,
     NominatedFieldDoesNotExistForESIndexingException,
 )
+from django_elasticsearch_model_binder.instrumentation import (
+    InstrumentedTransport,
+)
+
+logger = logging.getLogger(__name__)
+
+# Client shared by the process so connections are pooled between calls.
+es_client_registry = {}
 
 
 def get_es_client():
@@ -17,13 +44,238 @@ def get_es_client():
     Return the elasticsearch client instance, allows implementer to extend
     mixin here replacing this implementation with one more suited to
     their use case.
+
+    Set DJANGO_ES_MODEL_SERIALIZER to the import path of an elasticsearch
+    serializer class to replace the default json serializer, for example
+    django_elasticsearch_model_binder.serializers.OrjsonSerializer.
+
+    Set DJANGO_ES_MODEL_CIRCUIT_BREAKER to fail fast while the cluster is
+    unavailable, see ESCircuitBreaker.
     """
+    if 'default' in es_client_registry:
+        return es_client_registry['default']
+
     if not hasattr(settings, 'DJANGO_ES_MODEL_CONFIG'):
         raise ImproperlyConfigured(
             'DJANGO_ES_MODEL_CONFIG must be defined in app settings'
         )
 
-    return Elasticsearch(**settings.DJANGO_ES_MODEL_CONFIG)
+    client_config = dict(settings.DJANGO_ES_MODEL_CONFIG)
+    client_config.setdefault(
+        'transport_class',
+        InstrumentedTransport if get_es_circuit_breaker() is None
+        else CircuitBreakerTransport,
+    )
+    serializer = getattr(settings, 'DJANGO_ES_MODEL_SERIALIZER', None)
+    if serializer:
+        client_config['serializer'] = import_string(serializer)()
+
+    return es_client_registry.setdefault(
+        'default', Elasticsearch(**client_config)
+    )
+
+
+@receiver(setting_changed)
+def reset_es_client(setting, **kwargs):
+    """
+    Drop the shared client when its configuration is changed.
+    """
+    if setting.startswith('DJANGO_ES_MODEL_'):
+        es_client_registry.clear()
+
+
+def raise_on_bulk_errors(response):
+    """
+    Raise ElasticSearchFailure with the failing items of a bulk response.
+    """
+    if response['errors']:
+        raise ElasticSearchFailure([
+            item for item in response['items']
+            if 'error' in next(iter(item.values()))
+        ])
+
+
+def build_bulk_body(serializer, actions) -> str:
+    """
+    Serialize bulk actions, action metadata followed by any document
+    source, straight into a single NDJSON request body.
+    """
+    return ''.join(
+        serializer.dumps(line) + '\n'
+        for action, source in actions
+        for line in ((action,) if source is None else (action, source))
+    )
+
+
+def bulk_index_documents(documents, index: str, chunk_size=500):
+    """
+    Bulk index documents generated by build_documents_from_queryset,
+    returning the number indexed. Raises ElasticSearchFailure with the
+    failing items if any documents were rejected.
+    """
+    client = get_es_client()
+    documents = iter(documents)
+    indexed = 0
+
+    while True:
+        actions = []
+        for document in islice(documents, chunk_size):
+            metadata = {'_id': document['_id']}
+            if '_routing' in document:
+                metadata['routing'] = document['_routing']
+            actions.append(({'index': metadata}, document['_source']))
+
+        if not actions:
+            return indexed
+
+        raise_on_bulk_errors(client.bulk(
+            body=build_bulk_body(client.transport.serializer, actions),
+            index=index,
+        ))
+        indexed += len(actions)
+
+
+def send_bulk_writes(operations: dict, chunk_size=500, refresh=None) -> int:
+    """
+    Bulk send write operations, documents and their routing keyed by index
+    and pk, a document of None deleting the document. Returns the number
+    sent, raising ElasticSearchFailure with the failing items if any were
+    rejected.
+
+    operations is drained of those sent, and of those rejected outright
+    which are logged, so on failure it holds only what is worth retrying.
+    """
+    client = get_es_client()
+    params = {} if refresh is None else {'refresh': refresh}
+    sent = 0
+
+    while operations:
+        chunk = list(islice(operations.keys(), chunk_size))
+        actions = []
+        for index, pk in chunk:
+            document, routing = operations[index, pk]
+            metadata = {'_index': index, '_id': pk}
+            if routing is not None:
+                metadata['routing'] = routing
+            actions.append((
+                {'delete' if document is None else 'index': metadata},
+                document,
+            ))
+
+        response = client.bulk(
+            body=build_bulk_body(client.transport.serializer, actions),
+            params=params,
+        )
+
+        # Items are returned in the order they were sent.
+        for key, item in zip(chunk, response['items']):
+            result = next(iter(item.values()))
+            if 'error' not in result:
+                sent += 1
+            elif result['status'] in ES_OUTAGE_STATUSES:
+                continue
+            else:
+                logger.error(
+                    'Elasticsearch rejected the write of %s to %s: %s',
+                    key[1], key[0], result['error'],
+                )
+            del operations[key]
+
+        raise_on_bulk_errors(response)
+
+    return sent
+
+
+@receiver(es_write_spool_pending)
+def drain_es_write_spool(sender, circuit_breaker, wait=False, **kwargs):
+    """
+    Start sending writes spooled while the circuit was open from a
+    background thread, unless one already is. Set wait to instead send
+    them from the calling thread once any running drain has finished.
+    """
+    if not circuit_breaker.drain_lock.acquire(blocking=wait):
+        return
+
+    if wait:
+        send_spooled_es_writes(circuit_breaker)
+        return
+
+    circuit_breaker.drain_thread = Thread(
+        target=send_spooled_es_writes, args=(circuit_breaker,), daemon=True,
+    )
+    circuit_breaker.drain_thread.start()
+
+
+def send_spooled_es_writes(circuit_breaker):
+    """
+    Send spooled writes in batches of spool_drain_batch_size until the
+    spool is empty, stopping once a batch fails with writes worth retrying
+    which are returned to the spool. Releases the drain lock acquired by
+    drain_es_write_spool.
+    """
+    drained = False
+    try:
+        while True:
+            operations = circuit_breaker.spool.take(
+                circuit_breaker.spool_drain_batch_size
+            )
+            if not operations:
+                drained = True
+                return
+
+            try:
+                send_bulk_writes(operations)
+            except Exception:
+                logger.exception(
+                    'Failed draining spooled Elasticsearch writes'
+                )
+                # Carry on past writes that were rejected outright.
+                if operations:
+                    return
+            finally:
+                circuit_breaker.spool.restore(operations)
+    finally:
+        circuit_breaker.drain_lock.release()
+        # Writes spooled between finding the spool empty and releasing the
+        # lock would otherwise wait on the next request to be drained.
+        if drained and circuit_breaker.spool.operations:
+            es_write_spool_pending.send(
+                sender=type(circuit_breaker), circuit_breaker=circuit_breaker,
+            )
+
+
+# Pks of models saved or deleted while a rebuild of their index is in
+# progress, keyed by model class. Used by rebuild_es_index to catch the new
+# index up on writes that happened after their chunk had been indexed.
+es_rebuild_change_logs = {}
+
+
+def start_es_rebuild_change_log(model_class) -> set:
+    """
+    Begin recording pks of model_class instances modified in this process,
+    returning the set changes will be recorded into.
+    """
+    return es_rebuild_change_logs.setdefault(model_class, set())
+
+
+def stop_es_rebuild_change_log(model_class):
+    """
+    Stop recording changes for model_class, discarding any unapplied pks.
+    """
+    es_rebuild_change_logs.pop(model_class, None)
+
+
+def record_es_rebuild_change(model_class, pk) -> bool:
+    """
+    Record a modified model pk if its index is currently being rebuilt,
+    returning whether a rebuild was in progress.
+    """
+    change_log = es_rebuild_change_logs.get(model_class)
+    if change_log is None:
+        return False
+
+    change_log.add(pk)
+    return True
 
 
 def queryset_iterator(queryset, chunk_size=1000):
@@ -34,50 +286,273 @@ def queryset_iterator(queryset, chunk_size=1000):
     ordering will be ignored.
     """
     try:
-        last_pk = queryset.order_by('-pk')[:1].get().pk
+        last_pk = (
+            queryset.order_by('-pk').values_list('pk', flat=True)[:1].get()
+        )
     except ObjectDoesNotExist:
         return
 
     pk = 0
     queryset = queryset.order_by('pk')
     while pk < last_pk:
-        queryset_chunk = queryset.filter(pk__gt=pk)[:chunk_size]
-        pk = queryset_chunk[len(queryset_chunk) - 1].pk
+        # Only pks are read to find the chunk boundary, leaving loading the
+        # chunk itself to the caller.
+        chunk_pks = list(
+            queryset.filter(pk__gt=pk).values_list('pk', flat=True)
+            [:chunk_size]
+        )
+        queryset_chunk = queryset.filter(pk__gt=pk, pk__lte=chunk_pks[-1])
+        pk = chunk_pks[-1]
         yield queryset_chunk
 
 
-def initialize_es_model_index(model):
+def convert_datetime_to_es_format(value):
+    """
+    Format a datetime as ISO-8601, naive datetimes are taken to be in the
+    current timezone when USE_TZ is enabled.
+    """
+    if value is None:
+        return None
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value.isoformat()
+
+
+def convert_date_to_es_format(value):
+    return None if value is None else value.isoformat()
+
+
+def convert_decimal_to_es_format(value):
+    return None if value is None else float(value)
+
+
+def convert_uuid_to_es_format(value):
+    return None if value is None else str(value)
+
+
+def convert_duration_to_es_format(value):
+    return None if value is None else value.total_seconds()
+
+
+def convert_boolean_to_es_format(value):
+    return None if value is None else bool(value)
+
+
+# Converters for values read off model fields, looked up against the field
+# class MRO. None marks values that are already in an indexable format.
+ES_FIELD_CONVERTERS = {
+    models.BooleanField: convert_boolean_to_es_format,
+    models.CharField: None,
+    models.TextField: None,
+    models.IntegerField: None,
+    models.FloatField: None,
+    models.DecimalField: convert_decimal_to_es_format,
+    models.UUIDField: convert_uuid_to_es_format,
+    models.DateTimeField: convert_datetime_to_es_format,
+    models.DateField: convert_date_to_es_format,
+    models.TimeField: convert_date_to_es_format,
+    models.DurationField: convert_duration_to_es_format,
+}
+
+# Elasticsearch field mappings for values read off model fields, looked up
+# against the field class MRO in the same way as ES_FIELD_CONVERTERS.
+ES_FIELD_MAPPINGS = {
+    models.BooleanField: {'type': 'boolean'},
+    models.CharField: {
+        'type': 'text',
+        'fields': {'keyword': {'type': 'keyword', 'ignore_above': 256}},
+    },
+    models.TextField: {'type': 'text'},
+    models.EmailField: {'type': 'keyword'},
+    models.SlugField: {'type': 'keyword'},
+    models.URLField: {'type': 'keyword'},
+    models.SmallIntegerField: {'type': 'short'},
+    models.IntegerField: {'type': 'integer'},
+    models.BigIntegerField: {'type': 'long'},
+    models.AutoField: {'type': 'integer'},
+    models.BigAutoField: {'type': 'long'},
+    models.FloatField: {'type': 'double'},
+    models.DecimalField: {'type': 'double'},
+    models.UUIDField: {'type': 'keyword'},
+    models.DateTimeField: {'type': 'date'},
+    models.DateField: {'type': 'date'},
+    models.TimeField: {'type': 'keyword'},
+    models.DurationField: {'type': 'double'},
+}
+
+if hasattr(models, 'JSONField'):
+    ES_FIELD_CONVERTERS[models.JSONField] = None
+    ES_FIELD_MAPPINGS[models.JSONField] = {'type': 'object'}
+
+try:
+    from django.contrib.postgres.fields import ArrayField, JSONField
+except ImportError:
+    ArrayField = None
+else:
+    ES_FIELD_CONVERTERS[JSONField] = None
+    ES_FIELD_MAPPINGS[JSONField] = {'type': 'object'}
+
+
+def get_es_field_converter(field, default: Callable) -> Optional[Callable]:
+    """
+    Select the converter for values of a model field, resolved once per
+    field so values can be converted column-wise. Relations are converted
+    as the field they point to, values for unknown field types fall back
+    to default. Returns None if values need no conversion.
+    """
+    if field.is_relation:
+        return get_es_field_converter(field.target_field, default)
+
+    if ArrayField is not None and isinstance(field, ArrayField):
+        base_converter = get_es_field_converter(field.base_field, default)
+        if base_converter is None:
+            return None
+
+        def convert_array_to_es_format(value):
+            if value is None:
+                return None
+            return [base_converter(v) for v in value]
+
+        return convert_array_to_es_format
+
+    for field_class in type(field).__mro__:
+        if field_class in ES_FIELD_CONVERTERS:
+            return ES_FIELD_CONVERTERS[field_class]
+
+    return default
+
+
+def get_es_field_mapping(field) -> Optional[dict]:
+    """
+    Select the Elasticsearch mapping for values of a model field, keyword
+    for relations and fields with choices as they are only ever matched
+    exactly. Returns None for unknown field types, leaving them to be
+    mapped dynamically.
+    """
+    if field.is_relation or field.choices:
+        return {'type': 'keyword'}
+
+    if ArrayField is not None and isinstance(field, ArrayField):
+        return get_es_field_mapping(field.base_field)
+
+    for field_class in type(field).__mro__:
+        if field_class in ES_FIELD_MAPPINGS:
+            return dict(ES_FIELD_MAPPINGS[field_class])
+
+    return None
+
+
+def build_index_mapping(model) -> dict:
+    """
+    Generate index settings and mappings for the fields nominated by
+    es_cached_model_fields. Fields listed in es_unindexed_fields are only
+    stored for retrieval, neither indexed for searching nor kept in doc
+    values for sorting and aggregating, es_source_excludes are indexed but
+    left out of the stored _source.
+    """
+    properties = {}
+    field_names = list(model.es_cached_model_fields)
+    if 'pk' not in field_names:
+        field_names.append('pk')
+
+    for field_name in field_names:
+        if field_name == 'pk':
+            field = model._meta.pk
+        else:
+            try:
+                field = model._meta.get_field(field_name)
+            except FieldDoesNotExist:
+                continue
+
+        mapping = get_es_field_mapping(field)
+        if mapping is None:
+            continue
+
+        if field_name in model.es_unindexed_fields:
+            if mapping['type'] == 'object':
+                mapping = {'type': 'object', 'enabled': False}
+            elif mapping['type'] == 'text':
+                mapping = {'type': 'text', 'index': False}
+            else:
+                mapping.update(index=False, doc_values=False)
+
+        properties[field_name] = mapping
+
+    mappings = {'properties': properties}
+    if model.es_source_excludes:
+        mappings['_source'] = {'excludes': list(model.es_source_excludes)}
+
+    return {'settings': {}, 'mappings': mappings}
+
+
+def initialize_es_model_index(model, partition=None):
     """
     Taking a model utilizing the ESBoundModel, generate the
     default index and aliases into Elasticsearch, this is useful on first
     bootup of a new environment so a model has everything it needs to begin
     piping data to Elasticsearch.
 
+    For models with es_partition_field set, indices are generated for the
+    given partition, or every partition in the database if unset, with the
+    model read alias spanning all of them.
+
     NOTE: This will just create the corresponging index/aliases there will be
     no data present in these indexes, call rebuild_index on the model to begin
     setting up the models data in Elasticsearch.
     """
-    try:
-        get_index_names_from_alias(model.get_write_alias_name())
-    except NotFoundError:
-        # Only create a new index when we can't find a alias -> index
-        # relationship for this model.
-        new_indicy = model.generate_index()
-        model.bind_alias(new_indicy, model.get_write_alias_name())
-        model.bind_alias(new_indicy, model.get_read_alias_name())
+    if model.es_partition_field and partition is None:
+        for partition in model.get_es_partitions(
+            model.objects.all(), include_indexed=True,
+        ):
+            initialize_es_model_index(model, partition)
+        return
 
+    # Only create a new index when we can't find a alias -> index
+    # relationship for this model.
+    read_alias, write_alias = model.get_es_alias_names(partition)
+    if resolve_alias_indices(write_alias):
+        return
 
-def build_documents_from_queryset(queryset) -> Dict[int, dict]:
+    if partition is None:
+        new_indicy = model.generate_index()
+    else:
+        # Saves of the first models of a partition in separate processes
+        # all generate the same index rather than one each.
+        new_indicy = model.generate_index(partition, suffix='initial')
+    model.bind_alias(new_indicy, write_alias)
+    model.bind_alias(new_indicy, read_alias)
+
+    if partition is not None:
+        # The model read alias spans the indices of every partition.
+        alias = model.get_read_alias_name()
+        get_es_client().indices.update_aliases(body={'actions': [
+            {'add': {'index': new_indicy, 'alias': alias}},
+        ]})
+        clear_es_alias_cache(alias)
+
+
+def build_documents_from_queryset(
+    queryset, include_extra_fields=True,
+) -> Dict[int, dict]:
     """
     Generate a dictionary map of ES fields representing the
-    nominated model fields to be cached in the model index.
+    nominated model fields to be cached in the model index. Set
+    include_extra_fields=False to skip resolving es_cached_extra_fields.
     """
+    model = queryset.model
     try:
-        field_list = queryset.model.es_cached_model_fields
+        field_list = model.es_cached_model_fields
         if 'pk' not in field_list:
             field_list.append('pk')
-        queryset_values = queryset.values(*field_list)
-    except FieldError:
+        queryset_values = queryset.values_list(*field_list)
+        converters = [
+            model.get_es_field_converter(
+                model._meta.pk if field == 'pk'
+                else model._meta.get_field(field)
+            )
+            for field in field_list
+        ]
+    except (FieldError, FieldDoesNotExist):
         raise NominatedFieldDoesNotExistForESIndexingException(
             'One of the fields defined in es_cached_model_fields does '
             'not exist on the model {} only '
@@ -86,17 +561,32 @@ def build_documents_from_queryset(queryset) -> Dict[int, dict]:
             'this index'.format(queryset.model.__class__.__name__)
         )
 
+    rows = list(queryset_values)
+    pk_position = field_list.index('pk')
+
+    # Generate nominated fields for document inclusion off model, converting
+    # the values of the chunk a column at a time.
+    columns = [
+        column if converter is None else list(map(converter, column))
+        for column, converter in zip(zip(*rows), converters)
+    ]
     documents = {
-        model_values['pk']: {'_id': model_values['pk'], '_source': {}}
-        for model_values in queryset_values
+        row[pk_position]: {
+            '_id': row[pk_position],
+            '_source': dict(zip(field_list, values)),
+        }
+        for row, values in zip(rows, zip(*columns))
     }
 
-    # Generate nominated fields for document inclusion off model.
-    for model_values in queryset_values:
-        documents[model_values['pk']]['_source'] = {
-            k: queryset.model.convert_model_field_to_es_format(v)
-            for k, v in model_values.items()
-        }
+    if model.es_routing_field:
+        routing_position = field_list.index(model.es_routing_field)
+        for row in rows:
+            documents[row[pk_position]]['_routing'] = (
+                model.get_es_routing_value(row[routing_position])
+            )
+
+    if not include_extra_fields:
+        return documents
 
     # Generate and bulk resolve custom fields for document.
     for field_class in queryset.model.es_cached_extra_fields:
@@ -120,11 +610,17 @@ def build_document_from_model(model) -> dict:
     returning built document for indexing.
     """
     document = {}
-    model_fields = [f.name for f in model._meta.fields]
+    model_fields = {f.name: f for f in model._meta.fields}
+    model_fields['pk'] = model._meta.pk
+
+    # The pk is always stored so documents can be compared by pk range.
+    field_names = list(model.es_cached_model_fields)
+    if 'pk' not in field_names:
+        field_names.append('pk')
 
     # Generate index fields based on defined model fields.
-    for field in model.es_cached_model_fields:
-        if field not in model_fields and field != 'pk':
+    for field in field_names:
+        if field not in model_fields:
             raise NominatedFieldDoesNotExistForESIndexingException(
                 'field {} does not exist on model '
                 '{} only valid model fields can be '
@@ -134,9 +630,11 @@ def build_document_from_model(model) -> dict:
                 )
             )
 
-        document[field] = model.convert_model_field_to_es_format(
-            getattr(model, field)
-        )
+        # Read the raw value so relations resolve to their key without
+        # loading the related model.
+        converter = model.get_es_field_converter(model_fields[field])
+        value = model_fields[field].value_from_object(model)
+        document[field] = value if converter is None else converter(value)
 
     # Generate any custom fields not present on the model,
     # combining with those nominated on the model.
@@ -163,6 +661,239 @@ def get_index_names_from_alias(alias: str) -> List[str]:
     return [indicy for indicy in old_indicy_names]
 
 
+# Indices last resolved for each alias along with when they were resolved,
+# only aliases bound to at least one index are cached.
+es_alias_cache = {}
+
+
+def resolve_alias_indices(alias: str) -> List[str]:
+    """
+    Return the indices tied to an alias, reusing the result of previous
+    lookups for DJANGO_ES_MODEL_ALIAS_CACHE_TTL seconds (default 60), or
+    for as long as the circuit is open. Returns an empty list for aliases
+    that don't exist.
+    """
+    ttl = getattr(settings, 'DJANGO_ES_MODEL_ALIAS_CACHE_TTL', 60)
+    cached = es_alias_cache.get(alias)
+    if cached is not None and monotonic() - cached[0] < ttl:
+        return list(cached[1])
+
+    try:
+        indicy_names = get_index_names_from_alias(alias)
+    except NotFoundError:
+        es_alias_cache.pop(alias, None)
+        return []
+    except ElasticSearchCircuitOpen:
+        # Keep serving expired lookups while the cluster is unavailable so
+        # writes can still be spooled.
+        if cached is None:
+            raise
+        return list(cached[1])
+
+    cache_alias_indices(alias, indicy_names)
+    return indicy_names
+
+
+def cache_alias_indices(alias: str, indicy_names: List[str]):
+    """
+    Record the indices an alias is known to be bound to.
+    """
+    es_alias_cache[alias] = (monotonic(), list(indicy_names))
+
+
+def clear_es_alias_cache(*aliases):
+    """
+    Forget resolved indices for the given aliases, or for every alias if
+    none are given.
+    """
+    if not aliases:
+        es_alias_cache.clear()
+
+    for alias in aliases:
+        es_alias_cache.pop(alias, None)
+
+
+def export_es_documents(
+    queryset, directory: str, chunk_size=1000, documents_per_file=100000,
+) -> List[str]:
+    """
+    Stream the documents built for a queryset into gzipped NDJSON files
+    named by the pk range they hold, returning the written file paths.
+    Files hold bulk index actions so they can be sent to Elasticsearch as
+    they are by import_es_documents. Partitioned models aren't supported
+    as their documents are spread over an index per partition.
+    """
+    if queryset.model.es_partition_field:
+        raise ImproperlyConfigured(
+            'Exporting documents of partitioned models is not supported, '
+            'rebuild their indices instead.'
+        )
+
+    serializer = get_es_client().transport.serializer
+    base_path = os.path.join(directory, queryset.model.get_index_base_name())
+    paths = []
+    export_file = None
+
+    def close_export_file():
+        export_file.close()
+        path = '{}-{}-{}.ndjson.gz'.format(base_path, first_pk, last_pk)
+        os.replace(base_path + '.partial', path)
+        paths.append(path)
+
+    for qs_chunk in queryset_iterator(queryset, chunk_size):
+        for pk, document in build_documents_from_queryset(qs_chunk).items():
+            if export_file is None:
+                export_file = gzip.open(
+                    base_path + '.partial', 'wt', encoding='utf-8',
+                )
+                first_pk, file_documents = pk, 0
+
+            metadata = {'_id': document['_id']}
+            if '_routing' in document:
+                metadata['routing'] = document['_routing']
+            export_file.write(build_bulk_body(serializer, [
+                ({'index': metadata}, document['_source'])
+            ]))
+            last_pk = pk
+            file_documents += 1
+
+            if file_documents == documents_per_file:
+                close_export_file()
+                export_file = None
+
+    if export_file is not None:
+        close_export_file()
+
+    return paths
+
+
+def import_es_documents(
+    model, paths: List[str], drop_old_index=True, chunk_size=500,
+) -> str:
+    """
+    Bulk load files written by export_es_documents into a freshly
+    generated index, binding the model read alias to it once every file
+    has loaded. Returns the name of the new index.
+
+    As with rebuild_es_index the write alias is bound to the new index
+    first and models saved or deleted while the files load are re-applied
+    before the read alias is switched, set es_updated_at_field to also
+    pick up writes made by other processes. Partitioned models aren't
+    supported.
+    """
+    if model.es_partition_field:
+        raise ImproperlyConfigured(
+            'Importing documents of partitioned models is not supported, '
+            'rebuild their indices instead.'
+        )
+
+    new_indicy = model.generate_index()
+
+    old_indicy_names = set()
+    for alias in (model.get_read_alias_name(), model.get_write_alias_name()):
+        try:
+            old_indicy_names.update(get_index_names_from_alias(alias))
+        except NotFoundError:
+            pass
+
+    queryset = model.objects.all()
+    high_water_mark = model.get_es_high_water_mark(queryset)
+    changed_pks = start_es_rebuild_change_log(model)
+
+    try:
+        model.bind_alias(new_indicy, model.get_write_alias_name())
+
+        for path in paths:
+            with gzip.open(path, 'rt', encoding='utf-8') as import_file:
+                while True:
+                    # Each document is an action line followed by its
+                    # source.
+                    lines = list(islice(import_file, chunk_size * 2))
+                    if not lines:
+                        break
+
+                    raise_on_bulk_errors(get_es_client().bulk(
+                        body=''.join(lines), index=new_indicy,
+                    ))
+
+        model.catch_up_es_index(queryset, changed_pks, high_water_mark)
+        model.bind_alias(new_indicy, model.get_read_alias_name())
+    finally:
+        stop_es_rebuild_change_log(model)
+
+    if drop_old_index:
+        for old_indicy in old_indicy_names:
+            get_es_client().indices.delete(old_indicy)
+
+    return new_indicy
+
+
+def es_document_id_iterator(alias: str, chunk_size=1000,
+                            query=None) -> Iterator[List]:
+    """
+    Scroll through every document id stored behind an alias, or those
+    matching query when set, yielding them in lists of at most chunk_size
+    ids so the full id set is never held in memory.
+    """
+    ids = []
+    for hit in scan(
+        get_es_client(), index=alias, size=chunk_size,
+        query={'query': query or {'match_all': {}}, '_source': False},
+    ):
+        ids.append(hit['_id'])
+        if len(ids) == chunk_size:
+            yield ids
+            ids = []
+
+    if ids:
+        yield ids
+
+
+def get_es_sync_watermark(alias: str):
+    """
+    Return the es_updated_at_field value recorded by the last successful
+    sync of the index behind an alias, None if it has never been synced.
+    """
+    mappings = get_es_client().indices.get_mapping(index=alias)
+    for index_mapping in mappings.values():
+        watermark = (
+            index_mapping['mappings']
+            .get('_meta', {})
+            .get('es_sync_watermark')
+        )
+        if watermark is None:
+            continue
+
+        if watermark['type'] == 'datetime':
+            return parse_datetime(watermark['value'])
+        elif watermark['type'] == 'date':
+            return parse_date(watermark['value'])
+        return watermark['value']
+
+    return None
+
+
+def set_es_sync_watermark(alias: str, value):
+    """
+    Store the es_updated_at_field value synced up to within the index
+    mapping metadata, a rebuilt index starts without one.
+    """
+    if isinstance(value, datetime):
+        watermark = {'type': 'datetime', 'value': value.isoformat()}
+    elif isinstance(value, date):
+        watermark = {'type': 'date', 'value': value.isoformat()}
+    else:
+        watermark = {'type': 'value', 'value': value}
+
+    mappings = get_es_client().indices.get_mapping(index=alias)
+    for indicy, index_mapping in mappings.items():
+        meta = index_mapping['mappings'].get('_meta', {})
+        meta['es_sync_watermark'] = watermark
+        get_es_client().indices.put_mapping(
+            index=indicy, body={'_meta': meta},
+        )
+
+
 class ExtraModelFieldBase:
     """
     Base contract class to allow extra fields not present on the model to be
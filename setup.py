@@ -12,10 +12,14 @@ setup(
     license='MIT License',
     long_description=README,
     description=(),
+    python_requires='>=3.7',
     install_requires=[
         'django',
         'elasticsearch',
     ],
+    extras_require={
+        'orjson': ['orjson'],
+    },
     url='https://github.com/cr0mbly/django-elasticsearch-model-binder',
     author='Aidan Houlihan',
     author_email='aidandhoulihan@gmail.com',
@@ -26,7 +30,6 @@ setup(
         'License :: OSI Approved :: BSD License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Topic :: Internet :: WWW/HTTP',
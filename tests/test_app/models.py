@@ -40,3 +40,36 @@ class Author(ESBoundModel):
     es_cached_model_fields = ['publishing_name', 'user']
 
     objects = ESEnabledQuerySet.as_manager()
+
+
+class Book(ESBoundModel):
+    author = models.ForeignKey(Author, on_delete=models.CASCADE)
+    title = models.CharField(max_length=100)
+    status = models.CharField(
+        max_length=10, default='draft',
+        choices=(('draft', 'Draft'), ('published', 'Published')),
+    )
+    blurb = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    es_cached_model_fields = ['author', 'title', 'status', 'blurb']
+
+    es_unindexed_fields = ['blurb']
+
+    es_updated_at_field = 'updated_at'
+
+    objects = ESEnabledQuerySet.as_manager()
+
+
+class Event(ESBoundModel):
+    tenant = models.CharField(max_length=25)
+    name = models.CharField(max_length=100)
+    occurred_at = models.DateTimeField()
+
+    es_cached_model_fields = ['tenant', 'name', 'occurred_at']
+
+    es_partition_field = 'occurred_at'
+
+    es_routing_field = 'tenant'
+
+    objects = ESEnabledQuerySet.as_manager()
@@ -1,3 +1,5 @@
+import os
+
 SECRET_KEY = 'super-secret-key'
 
 INSTALLED_APPS = (
@@ -8,6 +10,7 @@ INSTALLED_APPS = (
     'django.contrib.messages',
     'django.contrib.admin.apps.SimpleAdminConfig',
     'django.contrib.staticfiles',
+    'django_elasticsearch_model_binder',
     'tests.test_app',
 )
 
@@ -28,3 +31,11 @@ DJANGO_ES_MODEL_CONFIG = {
         {'host': 'localhost', 'port': 9200}
     ]
 }
+
+# Run against the in-process fake cluster instead of a live node.
+if os.environ.get('DJANGO_ES_MODEL_FAKE_BACKEND'):
+    from django_elasticsearch_model_binder.testing import (
+        FakeElasticsearchConnection,
+    )
+
+    DJANGO_ES_MODEL_CONFIG['connection_class'] = FakeElasticsearchConnection
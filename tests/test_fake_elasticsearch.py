@@ -0,0 +1,53 @@
+from django.test import SimpleTestCase
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch.helpers import bulk, scan
+
+from django_elasticsearch_model_binder.testing import (
+    FakeElasticsearchConnection, fake_cluster,
+)
+
+
+class TestFakeElasticsearch(SimpleTestCase):
+    def setUp(self):
+        fake_cluster.reset()
+        self.client = Elasticsearch(
+            connection_class=FakeElasticsearchConnection,
+        )
+        self.client.indices.create(index='books-1')
+        self.client.indices.update_aliases(body={'actions': [
+            {'add': {'index': 'books-1', 'alias': 'books'}},
+        ]})
+
+    def test_documents_round_trip_through_aliases(self):
+        bulk(self.client, [
+            {'_id': i, '_source': {'title': 'Book {}'.format(i), 'pages': i}}
+            for i in range(1, 6)
+        ], index='books')
+
+        self.assertEqual(
+            'Book 2', self.client.get(index='books', id=2)['_source']['title'],
+        )
+        self.assertEqual(
+            ['4', '5'],
+            [
+                hit['_id'] for hit in self.client.search(index='books', body={
+                    'query': {'range': {'pages': {'gte': 4}}},
+                    'sort': [{'pages': {'order': 'asc'}}],
+                })['hits']['hits']
+            ],
+        )
+        self.assertEqual(
+            5, len(list(scan(self.client, index='books', size=2))),
+        )
+
+        self.client.delete(index='books', id=2)
+        with self.assertRaises(NotFoundError):
+            self.client.get(index='books', id=2)
+
+    def test_requests_are_counted(self):
+        request_count = fake_cluster.request_count
+        self.client.indices.exists_alias(name='books')
+        self.client.indices.get_alias(name='books')
+
+        self.assertEqual(2, fake_cluster.request_count - request_count)
@@ -1,12 +1,43 @@
+import gzip
+import json
+import os
+from datetime import datetime
+from io import StringIO
+from tempfile import TemporaryDirectory
+from decimal import Decimal
 from time import sleep
-
-from django.test import TestCase
-from elasticsearch.exceptions import NotFoundError
-
+from unittest import mock
+from uuid import UUID
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import models, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from elasticsearch.exceptions import ConnectionError, NotFoundError
+
+from django_elasticsearch_model_binder.buffer import flush_es_write_buffer
+from django_elasticsearch_model_binder.circuit import (
+    get_es_circuit_breaker, get_es_degraded_spool, reset_es_circuit_breaker,
+)
+from django_elasticsearch_model_binder.exceptions import (
+    ElasticSearchCircuitOpen, ElasticSearchFailure,
+)
+from django_elasticsearch_model_binder.instrumentation import (
+    ESOperationStats, es_operation_completed,
+)
+from django_elasticsearch_model_binder.models import ESBoundModel
+from django_elasticsearch_model_binder.testing import (
+    ESRoundTripBudgetExceeded, ESRoundTripBudgetMixin,
+)
 from django_elasticsearch_model_binder.utils import (
-    get_es_client, initialize_es_model_index, get_index_names_from_alias,
+    build_document_from_model, build_documents_from_queryset,
+    clear_es_alias_cache, export_es_documents, import_es_documents,
+    raise_on_bulk_errors, get_es_client, initialize_es_model_index,
+    get_index_names_from_alias, queryset_iterator, send_spooled_es_writes,
 )
-from tests.test_app.models import Author, User
+from tests.test_app.managers import ESEnabledQuerySet
+from tests.test_app.models import Author, Book, Event, User
 
 
 class ElasticSearchBaseTest(TestCase):
@@ -16,6 +47,7 @@ class ElasticSearchBaseTest(TestCase):
         """
         initialize_es_model_index(Author)
         initialize_es_model_index(User)
+        initialize_es_model_index(Book)
 
     def tearDown(self):
         """
@@ -23,6 +55,7 @@ class ElasticSearchBaseTest(TestCase):
         side affect free testing.
         """
         get_es_client().indices.delete('*')
+        clear_es_alias_cache()
 
 
 class TestElasticSearchAliasAndIndexGeneration(ElasticSearchBaseTest):
@@ -45,6 +78,34 @@ class TestElasticSearchAliasAndIndexGeneration(ElasticSearchBaseTest):
             .exists_alias(index=new_index, name=read_alias_name)
         )
 
+    def test_alias_name_overrides_without_partition_are_supported(self):
+        def get_read_alias_name(cls):
+            return 'author-read'
+
+        def get_write_alias_name(cls):
+            return 'author-write'
+
+        def generate_index(cls):
+            return ESBoundModel.generate_index.__func__(cls)
+
+        with mock.patch.multiple(
+            Author, get_read_alias_name=classmethod(get_read_alias_name),
+            get_write_alias_name=classmethod(get_write_alias_name),
+            generate_index=classmethod(generate_index),
+        ):
+            initialize_es_model_index(Author)
+            user = User.objects.create(email='test@gmail.com')
+            author = Author.objects.create(
+                publishing_name='Billy Fakington', age=4, user=user,
+            )
+            Author.rebuild_es_index()
+
+            self.assertEqual(
+                'Billy Fakington',
+                author.retrive_es_fields()['publishing_name'],
+            )
+            author.delete()
+
     def test_rebuild_optionally_drops_old_index(self):
         Author.rebuild_es_index()
 
@@ -145,7 +206,11 @@ class TestModelMaintainsStateAcrossDBandES(ElasticSearchBaseTest):
         document = author.retrive_es_fields()
 
         self.assertDictEqual(
-            {'publishing_name': self.publishing_name, 'user': author.user.pk},
+            {
+                'pk': author.pk,
+                'publishing_name': self.publishing_name,
+                'user': author.user.pk,
+            },
             document
         )
 
@@ -348,3 +413,1142 @@ class TestModelESQuerySetMixin(ElasticSearchBaseTest):
             },
             field_only_documents
         )
+
+
+class TestRebuildCatchUp(ElasticSearchBaseTest):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create(email='test@gmail.com')
+        self.author = Author.objects.create(
+            publishing_name='Billy Fakington', age=4, user=self.user,
+        )
+
+    def test_writes_during_rebuild_reach_both_indices(self):
+        old_index = get_index_names_from_alias(Author.get_read_alias_name())[0]
+        reindex_into_es = ESEnabledQuerySet.reindex_into_es
+
+        def reindex_then_save(queryset, **kwargs):
+            reindex_into_es(queryset, **kwargs)
+            self.author.publishing_name = 'Bobby Fakington'
+            self.author.save()
+
+        with mock.patch.object(
+            ESEnabledQuerySet, 'reindex_into_es', reindex_then_save,
+        ):
+            Author.rebuild_es_index(drop_old_index=False)
+
+        new_index = get_index_names_from_alias(Author.get_read_alias_name())[0]
+        self.assertNotEqual(old_index, new_index)
+
+        # Assert the write lands in the index serving reads during the
+        # rebuild as well as the index that replaces it.
+        for index in (old_index, new_index):
+            es_data = get_es_client().get(id=self.author.pk, index=index)
+            self.assertEqual(
+                'Bobby Fakington', es_data['_source']['publishing_name'],
+            )
+
+    def test_deletes_during_rebuild_are_caught_up(self):
+        removed_author = Author.objects.create(
+            publishing_name='Bobby Fakington', age=4, user=self.user,
+        )
+        removed_author_pk = removed_author.pk
+        reindex_into_es = ESEnabledQuerySet.reindex_into_es
+
+        def reindex_then_delete(queryset, **kwargs):
+            reindex_into_es(queryset, **kwargs)
+            if Author.objects.filter(pk=removed_author_pk).exists():
+                removed_author.delete()
+
+        with mock.patch.object(
+            ESEnabledQuerySet, 'reindex_into_es', reindex_then_delete,
+        ):
+            Author.rebuild_es_index()
+
+        with self.assertRaises(NotFoundError):
+            get_es_client().get(
+                id=removed_author_pk, index=Author.get_read_alias_name(),
+            )
+
+
+class TestIncrementalSync(ElasticSearchBaseTest):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create(email='test@gmail.com')
+        self.author = Author.objects.create(
+            publishing_name='Billy Fakington', age=4, user=self.user,
+        )
+        self.book = Book.objects.create(author=self.author, title='Draft')
+
+    def test_sync_resends_changed_models(self):
+        Book.sync_es_index()
+
+        # Queryset updates bypass save so are only picked up by the sync.
+        Book.objects.filter(pk=self.book.pk).update(
+            title='Published', updated_at=timezone.now(),
+        )
+        Book.sync_es_index()
+
+        es_data = get_es_client().get(
+            id=self.book.pk, index=Book.get_read_alias_name(),
+        )
+        self.assertEqual('Published', es_data['_source']['title'])
+
+    def test_sync_of_custom_queryset_keeps_watermark(self):
+        Book.sync_es_index()
+        book = Book.objects.create(author=self.author, title='Second')
+
+        Book.objects.filter(pk=self.book.pk).update(
+            title='Published', updated_at=timezone.now(),
+        )
+        Book.objects.filter(pk=book.pk).update(
+            title='Published', updated_at=timezone.now(),
+        )
+        Book.sync_es_index(queryset=Book.objects.filter(pk=book.pk))
+        Book.sync_es_index()
+
+        es_data = get_es_client().get(
+            id=self.book.pk, index=Book.get_read_alias_name(),
+        )
+        self.assertEqual('Published', es_data['_source']['title'])
+
+    def test_sync_removes_deleted_models(self):
+        book_pk = self.book.pk
+        Book.objects.filter(pk=book_pk).delete()
+        get_es_client().indices.refresh(index=Book.get_write_alias_name())
+
+        Book.sync_es_index()
+
+        with self.assertRaises(NotFoundError):
+            get_es_client().get(id=book_pk, index=Book.get_read_alias_name())
+
+    def test_sync_only_diffs_ranges_with_deleted_models(self):
+        books = [
+            Book.objects.create(author=self.author, title=title)
+            for title in ('First', 'Second', 'Third')
+        ]
+        Book.objects.filter(pk=books[1].pk).delete()
+        get_es_client().indices.refresh(index=Book.get_write_alias_name())
+
+        # Only the range holding the deleted model disagrees.
+        differences = [
+            (pks, sorted(document_ids, key=int))
+            for pks, document_ids in Book.iter_es_range_differences(
+                Book.objects.all(), Book.get_write_alias_name(),
+                chunk_size=1,
+            )
+        ]
+        self.assertEqual(
+            [([books[2].pk], [str(books[1].pk), str(books[2].pk)])],
+            differences,
+        )
+
+        Book.sync_es_index(queryset=Book.objects.none())
+
+        with self.assertRaises(NotFoundError):
+            get_es_client().get(
+                id=books[1].pk, index=Book.get_read_alias_name(),
+            )
+        es_count = get_es_client().count(index=Book.get_read_alias_name())
+        self.assertEqual(3, es_count['count'])
+
+
+class TestIndexConsistencyCheck(ElasticSearchBaseTest):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create(email='test@gmail.com')
+        self.author = Author.objects.create(
+            publishing_name='Billy Fakington', age=4, user=self.user,
+        )
+
+    def test_check_reports_and_repairs_drift(self):
+        stale_author = Author.objects.create(
+            publishing_name='Bobby Fakington', age=4, user=self.user,
+        )
+        Author.objects.filter(pk=stale_author.pk).update(
+            publishing_name='Bobby Fakington 2',
+        )
+        missing_author = Author.objects.create(
+            publishing_name='Billy Billyson', age=4, user=self.user,
+        )
+        Author.objects.filter(pk=missing_author.pk).delete_from_es()
+        extra_author_pk = self.author.pk
+        Author.objects.filter(pk=extra_author_pk).delete()
+        get_es_client().indices.refresh(index=Author.get_read_alias_name())
+
+        report = Author.check_es_index(
+            repair=True, compare_documents=True,
+        )
+
+        self.assertEqual([str(missing_author.pk)], report['missing'])
+        self.assertEqual([str(stale_author.pk)], report['stale'])
+        self.assertEqual([str(extra_author_pk)], report['extra'])
+
+        get_es_client().indices.refresh(index=Author.get_read_alias_name())
+        self.assertDictEqual(
+            {'missing': [], 'stale': [], 'extra': []},
+            Author.check_es_index(compare_documents=True),
+        )
+
+    def test_check_ignores_fields_excluded_from_source(self):
+        with mock.patch.object(Book, 'es_source_excludes', ['blurb']):
+            Book.rebuild_es_index()
+            book = Book.objects.create(
+                author=self.author, title='Draft', blurb='Long blurb',
+            )
+            get_es_client().indices.refresh(index=Book.get_read_alias_name())
+
+            es_data = get_es_client().get(
+                id=book.pk, index=Book.get_read_alias_name(),
+            )
+            report = Book.check_es_index(compare_documents=True)
+
+        self.assertNotIn('blurb', es_data['_source'])
+        self.assertDictEqual(
+            {'missing': [], 'stale': [], 'extra': []}, report,
+        )
+
+    def test_check_compares_counts_without_fetching_documents(self):
+        missing_author = Author.objects.create(
+            publishing_name='Billy Billyson', age=4, user=self.user,
+        )
+        Author.objects.filter(pk=missing_author.pk).delete_from_es()
+        get_es_client().indices.refresh(index=Author.get_read_alias_name())
+
+        with mock.patch.object(
+            type(get_es_client()), 'mget', side_effect=AssertionError,
+        ):
+            report = Author.check_es_index(chunk_size=1)
+
+        self.assertDictEqual(
+            {'missing': [str(missing_author.pk)], 'stale': [], 'extra': []},
+            report,
+        )
+
+
+class TestFieldConversion(TestCase):
+    def test_values_are_converted_to_native_es_types(self):
+        uuid = UUID('12345678123456781234567812345678')
+
+        self.assertIs(True, Author.convert_model_field_to_es_format(True))
+        self.assertIsNone(Author.convert_model_field_to_es_format(None))
+        self.assertEqual(
+            1.5, Author.convert_model_field_to_es_format(Decimal('1.5')),
+        )
+        self.assertEqual(
+            str(uuid), Author.convert_model_field_to_es_format(uuid),
+        )
+        self.assertEqual(
+            {'a': [1]}, Author.convert_model_field_to_es_format({'a': [1]}),
+        )
+        self.assertEqual(
+            '2020-03-01T10:05:00',
+            Author.convert_model_field_to_es_format(
+                datetime(2020, 3, 1, 10, 5)
+            ),
+        )
+
+    def test_converters_are_selected_per_field(self):
+        self.assertIsNone(
+            Author.get_es_field_converter(Author._meta.get_field('user'))
+        )
+        updated_at_converter = Book.get_es_field_converter(
+            Book._meta.get_field('updated_at')
+        )
+        self.assertEqual(
+            '2020-03-01T10:05:00',
+            updated_at_converter(datetime(2020, 3, 1, 10, 5)),
+        )
+
+    def test_overridden_model_converter_is_used_for_every_field(self):
+        def convert_model_field_to_es_format(cls, value):
+            return 'converted'
+
+        with mock.patch.object(
+            Author, 'convert_model_field_to_es_format',
+            classmethod(convert_model_field_to_es_format),
+        ):
+            document = build_document_from_model(
+                Author(publishing_name='Bill Fakeington', age=4),
+            )
+
+        self.assertEqual('converted', document['publishing_name'])
+
+
+class TestPluggableSerializer(ElasticSearchBaseTest):
+    @override_settings(
+        DJANGO_ES_MODEL_SERIALIZER=(
+            'django_elasticsearch_model_binder.serializers.OrjsonSerializer'
+        )
+    )
+    def test_documents_are_indexed_with_configured_serializer(self):
+        self.assertEqual(
+            'OrjsonSerializer',
+            type(get_es_client().transport.serializer).__name__,
+        )
+
+        user = User.objects.create(email='test@gmail.com')
+        author = Author.objects.create(
+            publishing_name='Billy Fakington', age=4, user=user,
+        )
+        Author.objects.filter(pk=author.pk).reindex_into_es()
+
+        es_data = get_es_client().get(
+            id=author.pk, index=Author.get_read_alias_name(),
+        )
+        self.assertEqual(
+            'Billy Fakington', es_data['_source']['publishing_name'],
+        )
+
+
+class TestNDJSONExportImport(ElasticSearchBaseTest):
+    def test_exported_documents_restore_into_new_index(self):
+        user = User.objects.create(email='test@gmail.com')
+        authors = [
+            Author.objects.create(
+                publishing_name='Billy Fakington {}'.format(i),
+                age=4, user=user,
+            )
+            for i in range(3)
+        ]
+        old_index = get_index_names_from_alias(Author.get_read_alias_name())[0]
+
+        with TemporaryDirectory() as directory:
+            call_command(
+                'export_es_documents', 'test_app.Author', directory,
+                '--documents-per-file=2', stdout=StringIO(),
+            )
+            paths = [
+                os.path.join(directory, path)
+                for path in os.listdir(directory)
+            ]
+            self.assertEqual(2, len(paths))
+
+            call_command(
+                'import_es_documents', 'test_app.Author', *paths,
+                stdout=StringIO(),
+            )
+
+        new_index = get_index_names_from_alias(Author.get_read_alias_name())[0]
+        self.assertNotEqual(old_index, new_index)
+        self.assertEqual(
+            [new_index],
+            get_index_names_from_alias(Author.get_write_alias_name()),
+        )
+
+        for author in authors:
+            es_data = get_es_client().get(id=author.pk, index=new_index)
+            self.assertEqual(
+                author.publishing_name, es_data['_source']['publishing_name'],
+            )
+
+    def test_routing_is_exported(self):
+        user = User.objects.create(email='test@gmail.com')
+        Author.objects.create(
+            publishing_name='Billy Fakington', age=4, user=user,
+        )
+
+        with TemporaryDirectory() as directory:
+            with mock.patch.object(Author, 'es_routing_field', 'user'):
+                path, = export_es_documents(Author.objects.all(), directory)
+            with gzip.open(path, 'rt', encoding='utf-8') as export_file:
+                action = json.loads(export_file.readline())
+
+        self.assertEqual(str(user.pk), action['index']['routing'])
+
+    def test_partitioned_models_are_not_supported(self):
+        with TemporaryDirectory() as directory:
+            with self.assertRaises(ImproperlyConfigured):
+                export_es_documents(Event.objects.all(), directory)
+        with self.assertRaises(ImproperlyConfigured):
+            import_es_documents(Event, [])
+
+    def test_writes_during_import_reach_new_index(self):
+        user = User.objects.create(email='test@gmail.com')
+        author = Author.objects.create(
+            publishing_name='Billy Fakington', age=4, user=user,
+        )
+
+        def save_then_check_errors(response):
+            author.publishing_name = 'Billy Fakington 2'
+            author.save()
+            return raise_on_bulk_errors(response)
+
+        with TemporaryDirectory() as directory:
+            paths = export_es_documents(Author.objects.all(), directory)
+            with mock.patch(
+                'django_elasticsearch_model_binder.utils'
+                '.raise_on_bulk_errors',
+                side_effect=save_then_check_errors,
+            ):
+                new_index = import_es_documents(Author, paths)
+
+        es_data = get_es_client().get(id=author.pk, index=new_index)
+        self.assertEqual(
+            'Billy Fakington 2', es_data['_source']['publishing_name'],
+        )
+
+
+class TestOperationInstrumentation(ElasticSearchBaseTest):
+    def setUp(self):
+        super().setUp()
+
+        self.stats = ESOperationStats()
+        self.stats.connect()
+        self.addCleanup(self.stats.disconnect)
+
+    def test_operations_are_aggregated(self):
+        user = User.objects.create(email='test@gmail.com')
+        Author.objects.create(
+            publishing_name='Billy Fakington', age=4, user=user,
+        )
+        Author.objects.all().reindex_into_es()
+
+        save_stats = self.stats.stats[('Author', 'save')]
+        self.assertEqual(1, save_stats['count'])
+        self.assertEqual(1, save_stats['documents'])
+        self.assertEqual(1, save_stats['es_requests'])
+        self.assertGreater(save_stats['bytes_sent'], 0)
+        self.assertGreater(save_stats['db_queries'], 0)
+
+        reindex_stats = self.stats.stats[('Author', 'reindex_into_es')]
+        self.assertEqual(1, reindex_stats['documents'])
+        self.assertEqual(1, reindex_stats['es_requests'])
+
+    def test_failing_receivers_are_logged(self):
+        def failing_receiver(sender, span, **kwargs):
+            raise ValueError('receiver failed')
+
+        es_operation_completed.connect(failing_receiver)
+        self.addCleanup(es_operation_completed.disconnect, failing_receiver)
+
+        user = User.objects.create(email='test@gmail.com')
+        with self.assertLogs(
+            'django_elasticsearch_model_binder.instrumentation', 'ERROR',
+        ):
+            author = Author.objects.create(
+                publishing_name='Billy Fakington', age=4, user=user,
+            )
+
+        self.assertEqual(1, self.stats.stats[('Author', 'save')]['count'])
+        self.assertIsNotNone(author.pk)
+
+
+class TestRoundTripBudgets(ESRoundTripBudgetMixin, ElasticSearchBaseTest):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create(email='test@gmail.com')
+        Author.objects.bulk_create(
+            Author(
+                publishing_name='Billy Fakington {}'.format(i),
+                age=4, user=self.user,
+            )
+            for i in range(10)
+        )
+
+    def test_save_stays_within_budget(self):
+        author = Author.objects.first()
+        author.publishing_name = 'Bobby Fakington'
+
+        with self.assertESRoundTrips(db_queries=1, es_requests=1):
+            author.save()
+
+    def test_reindex_chunks_stay_within_budget(self):
+        for qs_chunk in queryset_iterator(Author.objects.all(), chunk_size=3):
+            with self.assertESRoundTrips(db_queries=1, es_requests=1):
+                qs_chunk.reindex_into_es()
+
+    def test_filter_by_es_search_stays_within_budget(self):
+        with self.assertESRoundTrips(db_queries=0, es_requests=1):
+            Author.objects.filter_by_es_search(
+                query={'match': {'publishing_name': 'Billy'}},
+            )
+
+    def test_exceeding_budget_fails(self):
+        with self.assertRaises(ESRoundTripBudgetExceeded):
+            with self.assertESRoundTrips(es_requests=1):
+                list(Author.objects.all()[:2])
+                get_es_client().indices.exists_alias(
+                    name=Author.get_read_alias_name(),
+                )
+                get_es_client().indices.get_alias(
+                    name=Author.get_read_alias_name(),
+                )
+
+
+class TestAliasResolutionCache(ESRoundTripBudgetMixin, ElasticSearchBaseTest):
+    def test_rebind_is_a_single_request(self):
+        new_index = Author.generate_index()
+        write_alias = Author.get_write_alias_name()
+        old_index = get_index_names_from_alias(write_alias)[0]
+        Author.bind_alias(old_index, write_alias)
+
+        with self.assertESRoundTrips(es_requests=1):
+            Author.bind_alias(new_index, write_alias)
+
+        self.assertEqual([new_index], get_index_names_from_alias(write_alias))
+
+    def test_stale_cache_is_recovered_from(self):
+        write_alias = Author.get_write_alias_name()
+        old_index = get_index_names_from_alias(write_alias)[0]
+        Author.bind_alias(old_index, write_alias)
+
+        # Remove the alias behind the cache's back.
+        get_es_client().indices.delete_alias(index=old_index, name=write_alias)
+
+        new_index = Author.generate_index()
+        Author.bind_alias(new_index, write_alias)
+
+        self.assertEqual([new_index], get_index_names_from_alias(write_alias))
+
+
+class TestIndexMappingGeneration(TestCase):
+    def test_mapping_is_generated_from_field_types(self):
+        self.assertDictEqual(
+            {
+                'settings': {},
+                'mappings': {
+                    'properties': {
+                        'author': {'type': 'keyword'},
+                        'title': {
+                            'type': 'text',
+                            'fields': {
+                                'keyword': {
+                                    'type': 'keyword', 'ignore_above': 256,
+                                },
+                            },
+                        },
+                        'status': {'type': 'keyword'},
+                        'blurb': {'type': 'text', 'index': False},
+                        'pk': {'type': 'integer'},
+                    },
+                },
+            },
+            Book.get_index_mapping(),
+        )
+
+    def test_source_excludes_are_mapped(self):
+        with mock.patch.object(Book, 'es_source_excludes', ['blurb']):
+            mapping = Book.get_index_mapping()
+
+        self.assertEqual(
+            {'excludes': ['blurb']}, mapping['mappings']['_source'],
+        )
+
+
+class TestESCountsAndAggregations(
+    ESRoundTripBudgetMixin, ElasticSearchBaseTest,
+):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create(email='test@gmail.com')
+        for name, age in (('Billy', 4), ('Bobby', 4), ('Billy Bob', 30)):
+            Author.objects.create(
+                publishing_name=name, age=age, user=self.user,
+            )
+
+        Author.objects.all().reindex_into_es()
+        get_es_client().indices.refresh(index=Author.get_read_alias_name())
+
+    def test_count_by_es_search(self):
+        with self.assertESRoundTrips(db_queries=0, es_requests=1):
+            count = Author.objects.count_by_es_search(
+                query={'match': {'publishing_name': 'Billy'}},
+            )
+
+        self.assertEqual(2, count)
+
+    def test_aggregate_by_es_search(self):
+        with self.assertESRoundTrips(db_queries=0, es_requests=1):
+            aggregations = Author.objects.aggregate_by_es_search(
+                aggregations={
+                    'users': {'terms': {'field': 'user'}},
+                    'pks': {'stats': {'field': 'pk'}},
+                },
+                query={'match': {'publishing_name': 'Billy'}},
+            )
+
+        # The user isn't mapped so is dynamically mapped as a number.
+        self.assertEqual(
+            [{'key': self.user.pk, 'doc_count': 2}],
+            aggregations['users']['buckets'],
+        )
+        self.assertEqual(2, aggregations['pks']['count'])
+
+    def test_keyword_terms_are_keyed_by_string(self):
+        author = Author.objects.first()
+        for title in ('First', 'Second'):
+            Book.objects.create(author=author, title=title)
+        get_es_client().indices.refresh(index=Book.get_read_alias_name())
+
+        aggregations = Book.objects.aggregate_by_es_search(
+            aggregations={'authors': {'terms': {'field': 'author'}}},
+        )
+
+        # Relations are mapped as keywords.
+        self.assertEqual(
+            [{'key': str(author.pk), 'doc_count': 2}],
+            aggregations['authors']['buckets'],
+        )
+
+
+class TestESDocumentSearch(ESRoundTripBudgetMixin, ElasticSearchBaseTest):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create(email='test@gmail.com')
+        self.authors = [
+            Author.objects.create(
+                publishing_name=name, age=age, user=self.user,
+            )
+            for name, age in (('Billy', 4), ('Bobby', 5), ('Billy Bob', 30))
+        ]
+
+        Author.objects.all().reindex_into_es()
+        get_es_client().indices.refresh(index=Author.get_read_alias_name())
+
+    def test_search_es_documents_skips_the_database(self):
+        with self.assertESRoundTrips(db_queries=0, es_requests=1):
+            documents = Author.objects.search_es_documents(
+                query={'match_all': {}},
+                sort_query=[{'pk': {'order': 'desc'}}],
+                offset=1, limit=1,
+            )
+
+        self.assertEqual(1, len(documents))
+        self.assertEqual(self.authors[1].pk, documents[0].pk)
+        self.assertEqual('Bobby', documents[0].publishing_name)
+        self.assertEqual(self.user.pk, documents[0].user)
+
+        with self.assertRaises(AttributeError):
+            documents[0].publishing_name = 'Changed'
+
+    def test_search_es_documents_pk_comes_from_document_id(self):
+        # Documents indexed before the pk was stored lack it in _source.
+        get_es_client().index(
+            index=Author.get_write_alias_name(), id=self.authors[0].pk,
+            body={'publishing_name': 'Billy', 'age': 4},
+            refresh=True,
+        )
+
+        documents = Author.objects.search_es_documents(
+            query={'ids': {'values': [str(self.authors[0].pk)]}},
+        )
+
+        self.assertEqual([self.authors[0].pk], [
+            document.pk for document in documents
+        ])
+
+    def test_document_class_fields(self):
+        self.assertEqual(
+            ('pk', 'author', 'title', 'status', 'blurb'),
+            Book.get_es_document_class()._fields,
+        )
+
+
+@override_settings(DJANGO_ES_MODEL_WRITE_BUFFER={
+    'max_documents': 3, 'flush_interval_ms': 60000,
+})
+@mock.patch.object(Author, 'es_buffer_writes', True)
+class TestWriteBuffer(ESRoundTripBudgetMixin, TransactionTestCase):
+    def setUp(self):
+        initialize_es_model_index(Author)
+        initialize_es_model_index(User)
+        self.user = User.objects.create(email='test@gmail.com')
+
+    def tearDown(self):
+        flush_es_write_buffer()
+        get_es_client().indices.delete('*')
+        clear_es_alias_cache()
+
+    def get_es_document(self, author):
+        return get_es_client().get(
+            index=Author.get_read_alias_name(), id=author.pk, ignore=404,
+        ).get('_source')
+
+    def test_saves_are_coalesced_until_flushed(self):
+        author = Author(publishing_name='Billy', age=4, user=self.user)
+
+        with self.assertESRoundTrips(es_requests=0):
+            for i in range(5):
+                author.publishing_name = 'Billy {}'.format(i)
+                author.save()
+
+        self.assertIsNone(self.get_es_document(author))
+
+        with self.assertESRoundTrips(es_requests=1):
+            self.assertEqual(1, flush_es_write_buffer(refresh='wait_for'))
+
+        self.assertEqual(
+            'Billy 4', self.get_es_document(author)['publishing_name'],
+        )
+
+    def test_last_write_wins(self):
+        author = Author.objects.create(
+            publishing_name='Billy', age=4, user=self.user,
+        )
+        author_pk = author.pk
+        author.delete()
+        flush_es_write_buffer()
+
+        self.assertFalse(get_es_client().exists(
+            index=Author.get_read_alias_name(), id=author_pk,
+        ))
+
+    def test_flushed_once_max_documents_are_pending(self):
+        with self.assertESRoundTrips(es_requests=1):
+            authors = [
+                Author.objects.create(
+                    publishing_name='Billy {}'.format(i), age=4,
+                    user=self.user,
+                )
+                for i in range(3)
+            ]
+
+        self.assertEqual(
+            ['Billy 0', 'Billy 1', 'Billy 2'],
+            [self.get_es_document(a)['publishing_name'] for a in authors],
+        )
+
+    def test_direct_writes_replace_buffered_writes(self):
+        author = Author.objects.create(
+            publishing_name='Billy 1', age=4, user=self.user,
+        )
+        with transaction.atomic():
+            author.publishing_name = 'Billy 2'
+            author.save()
+        flush_es_write_buffer()
+
+        self.assertEqual(
+            'Billy 2', self.get_es_document(author)['publishing_name'],
+        )
+
+    def test_direct_deletes_replace_buffered_writes(self):
+        author = Author.objects.create(
+            publishing_name='Billy', age=4, user=self.user,
+        )
+        flush_es_write_buffer()
+        author.publishing_name = 'Billy 2'
+        author.save()
+        author_pk = author.pk
+        with transaction.atomic():
+            author.delete()
+        flush_es_write_buffer()
+
+        self.assertFalse(get_es_client().exists(
+            index=Author.get_read_alias_name(), id=author_pk,
+        ))
+
+    def test_failed_flush_keeps_writes_pending(self):
+        author = Author(publishing_name='Billy', age=4, user=self.user)
+        author.save()
+
+        with mock.patch(
+            'elasticsearch.Transport.perform_request',
+            side_effect=ConnectionError('N/A', 'Unreachable', None),
+        ):
+            with self.assertRaises(ConnectionError):
+                flush_es_write_buffer()
+
+        self.assertEqual(1, flush_es_write_buffer(refresh='wait_for'))
+        self.assertEqual(
+            'Billy', self.get_es_document(author)['publishing_name'],
+        )
+
+    def test_only_retryable_rejected_writes_are_kept(self):
+        authors = [
+            Author.objects.create(
+                publishing_name='Billy {}'.format(i), age=4, user=self.user,
+            )
+            for i in range(2)
+        ]
+        response = {'errors': True, 'items': [
+            {'index': {'status': 400, 'error': {'type': 'mapper_error'}}},
+            {'index': {'status': 429, 'error': {'type': 'rejected'}}},
+        ]}
+
+        with mock.patch.object(
+            type(get_es_client()), 'bulk', return_value=response,
+        ):
+            with self.assertLogs(
+                'django_elasticsearch_model_binder.utils', 'ERROR',
+            ):
+                with self.assertRaises(ElasticSearchFailure):
+                    flush_es_write_buffer()
+
+        self.assertEqual(1, flush_es_write_buffer(refresh='wait_for'))
+        self.assertIsNone(self.get_es_document(authors[0]))
+        self.assertEqual(
+            'Billy 1', self.get_es_document(authors[1])['publishing_name'],
+        )
+
+    def test_writes_in_atomic_blocks_are_not_buffered(self):
+        with transaction.atomic():
+            author = Author.objects.create(
+                publishing_name='Billy', age=4, user=self.user,
+            )
+
+        self.assertEqual(
+            'Billy', self.get_es_document(author)['publishing_name'],
+        )
+
+
+@override_settings(DJANGO_ES_MODEL_CIRCUIT_BREAKER={
+    'failure_threshold': 2, 'reset_timeout_ms': 60000,
+    'spool_max_documents': 10,
+})
+class TestCircuitBreaker(ElasticSearchBaseTest):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(email='test@gmail.com')
+
+    def tearDown(self):
+        reset_es_circuit_breaker(setting='DJANGO_ES_MODEL_CIRCUIT_BREAKER')
+        super().tearDown()
+
+    def open_circuit(self):
+        with mock.patch(
+            'elasticsearch.Transport.perform_request',
+            side_effect=ConnectionError('N/A', 'Unreachable', None),
+        ) as perform_request:
+            for _ in range(2):
+                with self.assertRaises(ConnectionError):
+                    get_es_client().info()
+
+        return perform_request
+
+    def test_fails_fast_once_open(self):
+        perform_request = self.open_circuit()
+
+        with self.assertRaises(ElasticSearchCircuitOpen):
+            get_es_client().info()
+
+        self.assertEqual(2, perform_request.call_count)
+
+    def test_writes_are_spooled_then_drained_once_closed(self):
+        self.open_circuit()
+
+        author = Author.objects.create(
+            publishing_name='Billy', age=4, user=self.user,
+        )
+        self.assertEqual(1, len(get_es_circuit_breaker().spool.operations))
+
+        # Let the next request through as a probe, closing the circuit.
+        get_es_circuit_breaker().opened_at -= 60
+        get_es_client().info()
+        get_es_circuit_breaker().drain_thread.join()
+
+        self.assertEqual({}, get_es_circuit_breaker().spool.operations)
+        self.assertEqual(
+            'Billy', author.retrive_es_fields()['publishing_name'],
+        )
+
+    def test_writes_spooled_as_drain_finishes_are_drained(self):
+        self.open_circuit()
+        authors = [
+            Author.objects.create(
+                publishing_name='Billy {}'.format(i), age=4, user=self.user,
+            )
+            for i in range(2)
+        ]
+        authors[1].publishing_name = 'Renamed'
+        document = build_document_from_model(authors[1])
+        spool = get_es_circuit_breaker().spool
+        take = spool.take
+        written = []
+
+        def take_then_write(limit=None):
+            # Write once the drain finds the spool empty but still holds the
+            # drain lock, as a save would.
+            operations = take(limit)
+            if not operations and not written:
+                get_es_degraded_spool().index(
+                    Author.get_write_alias_name(), authors[1].pk, document,
+                )
+                written.append(document)
+            return operations
+
+        # Drain from this thread, as drain_es_write_spool would.
+        get_es_circuit_breaker().drain_lock.acquire()
+        get_es_circuit_breaker().opened_at -= 60
+        get_es_client().info()
+        with mock.patch.object(spool, 'take', side_effect=take_then_write):
+            send_spooled_es_writes(get_es_circuit_breaker())
+            get_es_circuit_breaker().drain_thread.join()
+
+        self.assertEqual({}, spool.operations)
+        self.assertEqual(
+            'Renamed', authors[1].retrive_es_fields()['publishing_name'],
+        )
+
+    def test_spool_is_drained_at_exit(self):
+        self.open_circuit()
+        author = Author.objects.create(
+            publishing_name='Billy', age=4, user=self.user,
+        )
+
+        # Writes that can't be sent are logged as lost.
+        with self.assertLogs(
+            'django_elasticsearch_model_binder.circuit', 'ERROR',
+        ):
+            get_es_circuit_breaker().drain_at_exit()
+        self.assertEqual(1, len(get_es_circuit_breaker().spool.operations))
+
+        get_es_circuit_breaker().opened_at -= 60
+        get_es_circuit_breaker().drain_at_exit()
+
+        self.assertEqual({}, get_es_circuit_breaker().spool.operations)
+        self.assertEqual(
+            'Billy', author.retrive_es_fields()['publishing_name'],
+        )
+
+    @override_settings(DJANGO_ES_MODEL_CIRCUIT_BREAKER={
+        'failure_threshold': 2, 'reset_timeout_ms': 60000,
+        'spool_max_documents': 10, 'spool_drain_batch_size': 1,
+    })
+    def test_spool_is_drained_in_batches(self):
+        self.open_circuit()
+
+        authors = [
+            Author.objects.create(
+                publishing_name='Billy {}'.format(i), age=4, user=self.user,
+            )
+            for i in range(2)
+        ]
+        response = {'errors': True, 'items': [
+            {'index': {'status': 400, 'error': {'type': 'mapper_error'}}},
+        ]}
+
+        get_es_circuit_breaker().opened_at -= 60
+        with mock.patch.object(
+            type(get_es_client()), 'bulk', wraps=get_es_client().bulk,
+        ) as bulk:
+            # The first write is rejected outright so dropped.
+            bulk.side_effect = [response, mock.DEFAULT]
+            # Start the drain once logs are captured, it may log the
+            # rejection before it can be joined.
+            with self.assertLogs(
+                'django_elasticsearch_model_binder.utils', 'ERROR',
+            ):
+                get_es_client().info()
+                get_es_circuit_breaker().drain_thread.join()
+
+        self.assertEqual(2, bulk.call_count)
+        self.assertEqual({}, get_es_circuit_breaker().spool.operations)
+        with self.assertRaises(ElasticSearchFailure):
+            authors[0].retrive_es_fields()
+        self.assertEqual(
+            'Billy 1', authors[1].retrive_es_fields()['publishing_name'],
+        )
+
+    @override_settings(DJANGO_ES_MODEL_ALIAS_CACHE_TTL=0)
+    def test_partitioned_writes_are_spooled_once_alias_cache_expires(self):
+        event = Event.objects.create(
+            tenant='acme', name='Signup', occurred_at=datetime(2024, 1, 5),
+        )
+        self.open_circuit()
+
+        event.name = 'Renamed'
+        event.save()
+
+        self.assertEqual(1, len(get_es_circuit_breaker().spool.operations))
+
+    def test_failed_probe_reopens_circuit(self):
+        self.open_circuit()
+        get_es_circuit_breaker().opened_at -= 60
+
+        with mock.patch(
+            'elasticsearch.Transport.perform_request',
+            side_effect=ConnectionError('N/A', 'Unreachable', None),
+        ):
+            with self.assertRaises(ConnectionError):
+                get_es_client().info()
+
+        with self.assertRaises(ElasticSearchCircuitOpen):
+            get_es_client().info()
+
+
+class TestPartitionedIndices(ElasticSearchBaseTest):
+    def setUp(self):
+        super().setUp()
+
+        self.events = [
+            Event.objects.create(
+                tenant=tenant, name='Signup', occurred_at=occurred_at,
+            )
+            for tenant, occurred_at in (
+                ('acme', datetime(2024, 1, 5)),
+                ('acme', datetime(2024, 2, 5)),
+                ('initech', datetime(2024, 2, 20)),
+            )
+        ]
+        get_es_client().indices.refresh(index=Event.get_read_alias_name())
+
+    def test_documents_are_written_to_their_partition(self):
+        self.assertEqual(['2024-01', '2024-02'], Event.get_es_partitions(
+            Event.objects.all(),
+        ))
+        self.assertEqual(2, len(
+            get_index_names_from_alias(Event.get_read_alias_name())
+        ))
+
+        for event in self.events:
+            partition = event.get_es_document_partition()
+            self.assertEqual(
+                'Signup', event.retrive_es_fields()['name'],
+            )
+            self.assertTrue(get_es_client().exists(
+                index=Event.get_write_alias_name(partition), id=event.pk,
+                routing=event.tenant,
+            ))
+
+        self.assertEqual(
+            3, Event.objects.count_by_es_search(query={'match_all': {}}),
+        )
+
+    def test_partition_names_are_safe_and_distinct(self):
+        names = [
+            Event.get_write_alias_name(partition)
+            for partition in ('2024-01', 'Acme Corp', 'acme corp')
+        ]
+
+        self.assertEqual(
+            Event.get_index_base_name() + '-2024-01-write', names[0],
+        )
+        self.assertTrue(names[1].startswith(
+            Event.get_index_base_name() + '-acme-corp-'
+        ))
+        self.assertNotEqual(names[1], names[2])
+        for name in names:
+            self.assertEqual(name.lower(), name)
+            self.assertNotIn(' ', name)
+
+    def test_first_partition_index_is_shared(self):
+        index = Event.generate_index('2024-03', suffix='initial')
+        self.assertEqual(
+            index, Event.generate_index('2024-03', suffix='initial'),
+        )
+
+        initialize_es_model_index(Event, '2024-03')
+
+        self.assertEqual([index], get_index_names_from_alias(
+            Event.get_write_alias_name('2024-03')
+        ))
+
+    def test_writes_are_routed(self):
+        event = self.events[0]
+        with mock.patch.object(
+            get_es_client(), 'index', wraps=get_es_client().index,
+        ) as index:
+            event.save()
+
+        self.assertEqual('acme', index.call_args[1]['routing'])
+
+    def test_bulk_and_single_writes_route_alike(self):
+        documents = build_documents_from_queryset(Event.objects.all())
+
+        for event in self.events:
+            self.assertEqual(
+                event.get_es_routing(), documents[event.pk]['_routing'],
+            )
+
+    def test_routing_field_must_be_nominated(self):
+        with self.assertRaises(ImproperlyConfigured):
+            type('UnroutableEvent', (ESBoundModel,), {
+                '__module__': Event.__module__,
+                'tenant': models.CharField(max_length=25),
+                'es_cached_model_fields': [],
+                'es_routing_field': 'tenant',
+            })
+
+    def test_partition_date_format_must_be_filterable(self):
+        with self.assertRaises(ImproperlyConfigured):
+            type('WeeklyEvent', (ESBoundModel,), {
+                '__module__': Event.__module__,
+                'occurred_at': models.DateTimeField(),
+                'es_partition_field': 'occurred_at',
+                'es_partition_date_format': '%Y-w%W',
+            })
+
+    def test_partition_filter_spans_the_whole_bucket(self):
+        event = Event.objects.create(
+            tenant='acme', name='Signup',
+            occurred_at=datetime(2024, 12, 31, 23, 30),
+        )
+
+        with mock.patch.object(Event, 'es_partition_date_format', '%Y'):
+            self.assertEqual(
+                4, Event.filter_es_partition(Event.objects.all(), '2024')
+                .count(),
+            )
+        self.assertEqual(
+            [event], list(Event.filter_es_partition(
+                Event.objects.all(), '2024-12',
+            )),
+        )
+
+    def test_rebuild_single_partition(self):
+        untouched_index = get_index_names_from_alias(
+            Event.get_read_alias_name('2024-01')
+        )
+        old_index = get_index_names_from_alias(
+            Event.get_read_alias_name('2024-02')
+        )
+
+        Event.rebuild_es_index(partition='2024-02')
+
+        self.assertEqual(untouched_index, get_index_names_from_alias(
+            Event.get_read_alias_name('2024-01')
+        ))
+        new_index = get_index_names_from_alias(
+            Event.get_read_alias_name('2024-02')
+        )
+        self.assertNotEqual(old_index, new_index)
+        self.assertEqual(
+            sorted(untouched_index + new_index),
+            sorted(get_index_names_from_alias(Event.get_read_alias_name())),
+        )
+        self.assertEqual(
+            3, Event.objects.count_by_es_search(query={'match_all': {}}),
+        )
+
+    def test_check_covers_every_partition(self):
+        Event.objects.filter(pk=self.events[1].pk).update(name='Renamed')
+        # Leave the January partition without models.
+        Event.objects.filter(pk=self.events[0].pk).delete()
+
+        report = Event.check_es_index(
+            repair=True, compare_documents=True,
+        )
+
+        self.assertEqual([str(self.events[1].pk)], report['stale'])
+        self.assertEqual([str(self.events[0].pk)], report['extra'])
+        self.assertEqual(
+            2, Event.objects.count_by_es_search(query={'match_all': {}}),
+        )
+
+    def test_rebuild_empties_partitions_without_models(self):
+        Event.objects.filter(pk=self.events[0].pk).delete()
+
+        Event.rebuild_es_index()
+        get_es_client().indices.refresh(index=Event.get_read_alias_name())
+
+        self.assertEqual(
+            2, Event.objects.count_by_es_search(query={'match_all': {}}),
+        )
+
+    def test_sync_covers_partitions_without_models(self):
+        Event.objects.filter(pk=self.events[0].pk).delete()
+
+        with mock.patch.object(Event, 'es_updated_at_field', 'occurred_at'):
+            Event.sync_es_index()
+        get_es_client().indices.refresh(index=Event.get_read_alias_name())
+
+        self.assertEqual(
+            2, Event.objects.count_by_es_search(query={'match_all': {}}),
+        )